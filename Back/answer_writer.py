@@ -0,0 +1,403 @@
+# answer_writer.py
+# -*- coding: utf-8 -*-
+"""
+Escritura diferida (write-behind) de las respuestas de /api/answer.
+
+En vez de un INSERT + commit (un fsync) por respuesta, el request encola la
+fila y un hilo escritor las guarda por lotes: junta hasta BATCH_ROWS filas o
+espera FLUSH_MS, y las inserta con executemany en una sola transacción.
+Cada lote confirmado se agrega también al log de auditoría (audit_log.py)
+con una sola escritura.
+
+Modos (PPIA_ANSWER_WRITE):
+  async  el request sólo encola (por defecto)
+  wait   el request espera a que su lote esté confirmado (commit agrupado,
+         pero la respuesta sale ya persistida)
+  sync   como antes: INSERT + commit dentro del request
+Con la cola llena se aplica contrapresión: se espera hasta QUEUE_TIMEOUT a
+que haya lugar y, si no, la fila se escribe de forma síncrona (nunca se
+pierde). Al apagar el proceso se vacía la cola (atexit).
+
+Si un lote no se puede confirmar tras varios intentos (base bloqueada, disco
+lleno...), sus filas se guardan en un archivo de desborde junto a la base
+(<base>.spill-<pid>.jsonl, con fsync) y se reintentan en el siguiente lote,
+en flush() y cada SPILL_RETRY_S segundos; también los que haya dejado un
+proceso que ya terminó (el de un proceso vivo es sólo suyo: lo sigue
+escribiendo). Cada lote desbordado lleva un id que se registra en
+answer_spill_applied en la misma transacción que sus filas, así que
+reescribir dos veces el mismo archivo (caída entre el commit y el borrado)
+no duplica respuestas ni estadísticas.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+MODE = os.environ.get("PPIA_ANSWER_WRITE", "async")
+BATCH_ROWS = int(os.environ.get("PPIA_ANSWER_BATCH", "200"))
+FLUSH_MS = int(os.environ.get("PPIA_ANSWER_FLUSH_MS", "50"))
+MAX_QUEUE = int(os.environ.get("PPIA_ANSWER_QUEUE", "5000"))
+QUEUE_TIMEOUT = float(os.environ.get("PPIA_ANSWER_QUEUE_TIMEOUT", "1.0"))
+# PRAGMA synchronous de la conexión del escritor ("" = el del pool; FULL = más durable)
+WRITER_SYNCHRONOUS = os.environ.get("PPIA_ANSWER_SYNCHRONOUS", "")
+SPILL_RETRY_S = 5.0
+
+_INSERT_SQL = "INSERT INTO interactions (user_id, question_id, success, ts) VALUES (?, ?, ?, ?)"
+# Lotes del desborde ya confirmados (reescritura idempotente)
+_SPILL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answer_spill_applied (
+    id TEXT PRIMARY KEY,
+    applied_at TEXT NOT NULL
+)
+"""
+
+
+class _Batch(list):
+    """Filas de un lote; `memo` lo comparten los hooks (p. ej. item_stats.first_attempts)."""
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.memo = {}
+
+
+class _Answer:
+    __slots__ = ("row", "done", "seq")
+
+    def __init__(self, row, done=None, seq=0):
+        self.row = row      # (user_id, question_id, success, ts)
+        self.done = done    # threading.Event en modo "wait"
+        self.seq = seq      # orden de llegada (marca de agua de flush)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class AnswerWriter:
+    def __init__(self, pool, audit=None, mode=MODE, batch_rows=BATCH_ROWS,
+                 flush_ms=FLUSH_MS, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT,
+                 logger=None):
+        self.pool = pool
+        self.audit = audit
+        self.logger = logger or logging.getLogger(__name__)
+        self.spill_base = os.path.splitext(pool.path)[0] + ".spill"
+        self.mode = mode
+        self.batch_rows = batch_rows
+        self.flush_ms = flush_ms
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # Funciones fn(con, rows) que corren dentro de la transacción de cada lote
+        self._hooks = []
+        self._lock = threading.Lock()
+        self._reset_state()
+        atexit.register(self.close)
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_queue)
+        self._thread = None
+        self._stop = False
+        self._idle = threading.Condition()
+        # seq -> None de lo encolado y aún sin confirmar (en orden de llegada)
+        self._outstanding = {}
+        self._seq = 0
+        self._spill_lock = threading.Lock()
+        self._spill_check = 0.0
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.sync_writes = 0
+        self.backpressure_waits = 0
+        self.errors = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.commit_s = 0.0
+
+    def add_batch_hook(self, fn):
+        """Registra fn(con, rows): se llama con cada lote, en la misma transacción."""
+        self._hooks.append(fn)
+
+    # ---------------------------
+    # Lado del request
+    # ---------------------------
+    def submit(self, user_id: int, question_id: int, success: int, ts: str):
+        row = (user_id, question_id, success, ts)
+        if self.mode == "sync":
+            self._write_sync([row])
+            return
+        self._ensure_thread()
+        item = _Answer(row, threading.Event() if self.mode == "wait" else None)
+        with self._idle:
+            self._seq += 1
+            item.seq = self._seq
+            self._outstanding[item.seq] = None
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.backpressure_waits += 1
+            try:
+                self._queue.put(item, timeout=self.queue_timeout)
+            except queue.Full:
+                # El escritor no da abasto: la escribimos nosotros
+                self._done([item])
+                self._write_sync([row])
+                return
+        self.enqueued += 1
+        if item.done is not None:
+            item.done.wait()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Espera a que todo lo encolado HASTA ESTE MOMENTO esté confirmado en la
+        base (lo que llegue después no la demora) e intenta reescribir el
+        desborde pendiente.
+        """
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            mark = self._seq
+            while self._outstanding and next(iter(self._outstanding)) <= mark:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._idle.wait(left)
+        self._replay_spill(wait=True)
+        return True
+
+    def close(self):
+        """Vacía la cola y detiene el escritor (al apagar el proceso)."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.flush()
+        self._stop = True
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "depth": self.depth(),
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0,
+            "sync_writes": self.sync_writes,
+            "backpressure_waits": self.backpressure_waits,
+            "errors": self.errors,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "commit_s": round(self.commit_s, 4),
+        }
+
+    # ---------------------------
+    # Hilo escritor
+    # ---------------------------
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            # Después de un fork el hilo del padre no existe en el hijo
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_state()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True, name="answer-writer")
+                    self._thread.start()
+
+    def _run(self):
+        while not (self._stop and self._queue.empty()):
+            if time.monotonic() >= self._spill_check:
+                self._replay_spill()
+            try:
+                first = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while len(batch) < self.batch_rows:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=left))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch([a.row for a in batch])
+            finally:
+                self._done(batch)
+
+    def _done(self, items):
+        for a in items:
+            if a.done is not None:
+                a.done.set()
+        with self._idle:
+            for a in items:
+                self._outstanding.pop(a.seq, None)
+            self._idle.notify_all()
+
+    def _write_batch(self, rows, attempts: int = 3):
+        for attempt in range(attempts):
+            try:
+                self._commit(rows)
+                break
+            except Exception as e:
+                self.errors += 1
+                if attempt == attempts - 1:
+                    self.logger.error("answer_writer: no se pudieron guardar %d respuestas (%s); "
+                                      "van al desborde %s", len(rows), e, self._spill_path())
+                    self._spill(rows)
+                    return
+                time.sleep(0.05 * (attempt + 1))
+        self.batches += 1
+        self.written += len(rows)
+        self.max_batch = max(self.max_batch, len(rows))
+        self._log(rows)
+
+    def _write_sync(self, rows):
+        self.sync_writes += 1
+        self._commit(rows)
+        self.written += len(rows)
+        self._log(rows)
+
+    def _commit(self, rows, spilled=None):
+        """
+        Inserta rows y corre los hooks en una transacción. Con spilled
+        ([(id de lote, fila), ...] del desborde) se ignoran rows: se insertan
+        sólo los lotes que no estén en answer_spill_applied y se registran ahí
+        en la misma transacción. Devuelve las filas efectivamente insertadas.
+        """
+        con = self.pool.connect()
+        try:
+            if WRITER_SYNCHRONOUS:
+                con.execute(f"PRAGMA synchronous={WRITER_SYNCHRONOUS}")
+            t0 = time.perf_counter()
+            if spilled is not None:
+                con.execute(_SPILL_SCHEMA)
+            with con:
+                if spilled is not None:
+                    ids = sorted({sid for sid, _ in spilled})
+                    done = {r[0] for r in con.execute(
+                        f"SELECT id FROM answer_spill_applied WHERE id IN ({','.join('?' * len(ids))})", ids)}
+                    rows = [row for sid, row in spilled if sid not in done]
+                    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+                    con.executemany("INSERT INTO answer_spill_applied (id, applied_at) VALUES (?, ?)",
+                                    [(sid, now) for sid in ids if sid not in done])
+                if rows:
+                    con.executemany(_INSERT_SQL, rows)
+                    batch = _Batch(rows)
+                    for hook in self._hooks:
+                        hook(con, batch)
+            self.commit_s += time.perf_counter() - t0
+            return rows
+        finally:
+            if WRITER_SYNCHRONOUS:
+                con.execute(f"PRAGMA synchronous={self.pool.pragmas.get('synchronous', 'NORMAL')}")
+            con.close()
+
+    def _log(self, rows):
+        if self.audit is None:
+            return
+        try:
+            self.audit.log_answers(rows)
+        except OSError as e:
+            self.logger.error("answer_writer: no se pudo escribir el log de auditoría: %s", e)
+
+    # ---------------------------
+    # Desborde (lotes que no se pudieron confirmar)
+    # ---------------------------
+    def _spill_path(self) -> str:
+        return f"{self.spill_base}-{os.getpid()}.jsonl"
+
+    def _spill(self, rows):
+        """
+        Guarda las filas en el archivo de desborde del proceso (append + fsync),
+        una por línea como [id del lote, user_id, question_id, success, ts].
+        """
+        spill_id = uuid.uuid4().hex
+        with self._spill_lock:
+            with open(self._spill_path(), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps([spill_id, *r]) + "\n" for r in rows))
+                f.flush()
+                os.fsync(f.fileno())
+            self.spilled += len(rows)
+            self._spill_check = 0.0  # reintentar en la próxima vuelta
+
+    def _claimable_spills(self):
+        """
+        Archivos de desborde listos para reescribir: el propio (protegido por
+        _spill_lock) y los de procesos que ya no existen. El de otro proceso
+        vivo no se toca: podría estar agregándole filas en este momento.
+        """
+        me = os.getpid()
+        paths = []
+        prefix = len(self.spill_base) + 1
+        for path in glob.glob(glob.escape(self.spill_base) + "-*.jsonl"):
+            pid = int(path[prefix:-len(".jsonl")])
+            if pid == me or not _pid_alive(pid):
+                paths.append(path)
+        for path in glob.glob(glob.escape(self.spill_base) + "-*.replay-*"):
+            # Reescritura que quedó a medias: sólo si el proceso que la tomó ya no existe
+            if not _pid_alive(int(path.rsplit("-", 1)[1])):
+                paths.append(path)
+        return paths
+
+    def _read_spill(self, path):
+        """[(id del lote, fila), ...]; una línea cortada (caída a mitad de un append) se descarta."""
+        spilled = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    sid, *row = json.loads(line)
+                except ValueError:
+                    self.logger.error("answer_writer: línea ilegible en el desborde %s: %r", path, line[:200])
+                    continue
+                spilled.append((sid, tuple(row)))
+        return spilled
+
+    def _replay_spill(self, wait: bool = False):
+        if not self._spill_lock.acquire(blocking=wait):
+            return  # el hilo escritor no espera a otro hilo que ya lo está haciendo
+        try:
+            self._spill_check = time.monotonic() + SPILL_RETRY_S
+            for path in self._claimable_spills():
+                claimed = f"{path.split('.replay-')[0]}.replay-{os.getpid()}"
+                try:
+                    os.rename(path, claimed)  # atómico: sólo un proceso lo toma
+                except OSError:
+                    continue
+                spilled = self._read_spill(claimed)
+                try:
+                    rows = self._commit(None, spilled=spilled) if spilled else []
+                except Exception as e:
+                    os.rename(claimed, path)
+                    self.logger.warning("answer_writer: el desborde %s sigue sin poder guardarse: %s", path, e)
+                    continue
+                os.remove(claimed)
+                self.replayed += len(rows)
+                self.written += len(rows)
+                if rows:
+                    self._log(rows)
+                self.logger.warning("answer_writer: %d respuestas recuperadas del desborde %s", len(rows), path)
+        finally:
+            self._spill_lock.release()
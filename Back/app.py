@@ -1,28 +1,40 @@
 # app.py
 # -*- coding: utf-8 -*-
 import os
-import csv
 import re
 import json
 import sqlite3
-import io
 from datetime import datetime
 from html import escape
 
 from flask import Flask, request, jsonify, session, send_from_directory, Response
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-
-from preguntas_loader import Preguntas
+from werkzeug.exceptions import InternalServerError
+
+from answer_writer import AnswerWriter
+from audit_log import AuditLog
+from csv_export import stream_csv, keyset_filters
+from db_pool import ConnectionPool, PoolTimeout
+from password_hasher import PasswordHasher, HasherBusy
+import item_stats
+import mastery
+import metrics
+from question_bank import load_question_bank, install_bank, current_bank, reload_bank, watch_bank
+from selection_index import split_temas
+from seen_cache import SeenCache, is_seen
+from session_store import SqliteSessionInterface
 
 # -----------------------------------
 # Config
 # -----------------------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "quiz.db")
+DB_PATH = os.environ.get("PPIA_DB_PATH", os.path.join(BASE_DIR, "quiz.db"))
+
+# Conexiones reutilizables con WAL, busy_timeout, mmap, etc. (ver db_pool.py)
+DB_POOL = ConnectionPool(DB_PATH)
 
 def ensure_schema():
-    con = sqlite3.connect(DB_PATH)
+    con = DB_POOL.connect()
     cur = con.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -46,14 +58,27 @@ def ensure_schema():
         FOREIGN KEY(user_id) REFERENCES users(id)
     );
     """)
+    # Mismo índice que db_init.py: también sirve el rango (user_id, id > ?) del caché de vistas
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_user ON interactions(user_id)")
+    # Filtros since/until de la exportación y el orden por ts
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_ts ON interactions(ts)")
+    # Intentos previos de un usuario en una pregunta (hooks de item_stats y mastery)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_user_question "
+                "ON interactions(user_id, question_id)")
+    # Estadísticas por pregunta, mantenidas por el escritor de respuestas (ver item_stats.py)
+    item_stats.ensure_schema(con)
+    # Resumen por usuario/tema para el dashboard (ver mastery.py)
+    mastery.ensure_schema(con)
     con.commit()
     con.close()
 
-ensure_schema()
+# Recarga automática al editar Preguntas.tex (segundos entre revisiones; 0 = apagado)
+BANK_WATCH_INTERVAL = float(os.environ.get("PPIA_BANK_WATCH", "0"))
 
+# Token para los endpoints /api/admin/* (sin token configurado quedan deshabilitados)
+ADMIN_TOKEN = os.environ.get("PPIA_ADMIN_TOKEN", "")
 
 
-LOG_CSV = os.path.join(BASE_DIR, "records.csv")
 FRONT_DIR = os.path.join(os.path.dirname(BASE_DIR), "Front")
 IMAGES_DIR = os.path.join(BASE_DIR, "imagenes")  # <— para logos/salida.png
 
@@ -65,32 +90,67 @@ app.config.update(
     SESSION_COOKIE_NAME="ppia_session"
 )
 app.secret_key = os.environ.get("SECRET_KEY", "dev_secret_key_change_me")
+# Nivel del logger de la app (recargas del banco, escritor de respuestas, pool): INFO por defecto
+app.logger.setLevel(os.environ.get("PPIA_LOG_LEVEL", "INFO"))
+# Estado del quiz en el servidor (sessions.db, forma compacta); la cookie sólo lleva un id.
+# PPIA_SESSION_BACKEND=cookie vuelve a la sesión firmada en cookie de Flask.
+if os.environ.get("PPIA_SESSION_BACKEND", "sqlite") == "sqlite":
+    app.session_interface = SqliteSessionInterface(
+        os.environ.get("PPIA_SESSION_DB", os.path.join(BASE_DIR, "sessions.db"))
+    )
 CORS(app, supports_credentials=True)
 
-# CSV header si no existe
-if not os.path.isfile(LOG_CSV):
-    with open(LOG_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "user_id", "question_id", "success"])
-
-USERS_CSV = os.path.join(BASE_DIR, "users.csv")
-INTERACTIONS_CSV = os.path.join(BASE_DIR, "interactions.csv")
-
-if not os.path.isfile(USERS_CSV):
-    with open(USERS_CSV, "w", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow(["id","full_name","email","uniandes_code","magistral","complementarios","created_at"])
-
-if not os.path.isfile(INTERACTIONS_CSV):
-    with open(INTERACTIONS_CSV, "w", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow(["timestamp","user_id","email","question_id","success"])
+# Log de auditoría de registros y respuestas (JSON por línea, rotado y comprimido;
+# seguro con varios workers). Replay/verificación: python audit_log.py verify
+AUDIT_LOG = AuditLog(logger=app.logger)
 
 # -----------------------------------
 # Utilidades de DB
 # -----------------------------------
 def get_db():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+    # Conexión del pool: con.close() la devuelve para el próximo request
+    return DB_POOL.connect()
+
+# Preguntas ya vistas por cada usuario (bitsets en memoria, acotado y con expiración)
+SEEN_CACHE = SeenCache()
+
+# Hash de contraseñas en un pool acotado, con 503 + Retry-After si se satura (ver password_hasher.py)
+PASSWORD_HASHER = PasswordHasher()
+
+def busy_response(e):
+    # HasherBusy o PoolTimeout: 503 con Retry-After
+    resp = jsonify({"error": str(e)})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    app.logger.warning("Sin conexión libre a la base en %s %s", request.method, request.path)
+    return busy_response(e)
+
+@app.errorhandler(InternalServerError)
+def internal_error(e):
+    # Lo que falla fuera de la vista (p. ej. al abrir la sesión) llega como 500
+    if isinstance(e.original_exception, PoolTimeout):
+        return pool_timeout(e.original_exception)
+    return e
+
+# Respuestas de /api/answer: se encolan y un hilo las guarda por lotes (ver answer_writer.py)
+ANSWER_WRITER = AnswerWriter(DB_POOL, AUDIT_LOG, logger=app.logger)
+# question_stats se actualiza con cada lote, en la misma transacción
+ANSWER_WRITER.add_batch_hook(item_stats.update_stats)
+ANSWER_WRITER.add_batch_hook(mastery.make_hook(lambda qid: current_bank().index.temas_of.get(qid, ())))
+
+# Métricas Prometheus en /metrics: latencias por endpoint, SQL por request, colas y
+# cachés (ver metrics.py). PPIA_METRICS=0 las apaga.
+METRIC_POOLS = {"quiz": DB_POOL}
+if isinstance(app.session_interface, SqliteSessionInterface):
+    METRIC_POOLS["sessions"] = app.session_interface.pool
+if metrics.ENABLED:
+    metrics.instrument(app, METRIC_POOLS)
+    metrics.REGISTRY.add_collector(lambda: metrics.runtime_samples(
+        ANSWER_WRITER, PASSWORD_HASHER, SEEN_CACHE, current_bank(), METRIC_POOLS))
 
 def require_login():
     return "user_id" in session
@@ -99,24 +159,12 @@ def require_login():
 # Lógica de selección
 # -----------------------------------
 def get_available_temas(week: int):
-    temas = set()
-    for qid, data in Preguntas.items():
-        if data["week"] <= week:
-            for t in data["tema"].split(","):
-                temas.add(t.strip())
-    return sorted(t for t in temas if t)
+    return current_bank().index.temas_for_week(week)
 
 def retrieve_difs_for_temas(temas, week: int):
-    difs = set()
-    temas_set = set([t.strip() for t in temas])
-    for qid, data in Preguntas.items():
-        if data["week"] <= week:
-            q_temas = set([t.strip() for t in data["tema"].split(",")])
-            if q_temas & temas_set:
-                difs.add(data["dif"])
-    return sorted(difs)
-
-def pick_next_question(user_week, selected_theme, selected_difficulty, answered_ok_ids):
+    return current_bank().index.difs_for_temas(temas, week)
+
+def pick_next_question(user_week, selected_theme, selected_difficulty, answered_ok_ids, bank=None):
     """
     Selecciona la siguiente pregunta con estas reglas:
       - tema ∩ selected_theme != ∅
@@ -127,39 +175,40 @@ def pick_next_question(user_week, selected_theme, selected_difficulty, answered_
         (se consulta la tabla SQLite 'interactions')
       - Si no hay no-vistas, se elige entre las candidatas restantes
       - Selección aleatoria entre el conjunto final
+    bank: banco a usar (por defecto el activo).
     """
     import random
 
-    # 1) Filtros base por tema, semana y dificultad
-    temas = set([t.strip() for t in (selected_theme or "").split(",") if t.strip()])
-    candidates = []
-    for qid, data in Preguntas.items():
-        q_temas = set([t.strip() for t in data["tema"].split(",")])
-        if q_temas & temas and data["week"] <= user_week and data["dif"] <= selected_difficulty:
-            if qid not in (answered_ok_ids or []):  # no repetir acertadas en esta sesión
-                candidates.append(qid)
+    index = (bank or current_bank()).index
+
+    # 1) Filtros base por tema, semana y dificultad (vía índice invertido)
+    temas = split_temas(selected_theme)
+    answered_ok = set(answered_ok_ids or [])  # no repetir acertadas en esta sesión
+    candidates = [
+        qid for qid in index.candidates(temas, user_week, selected_difficulty)
+        if qid not in answered_ok
+    ]
 
     if not candidates:
         return None
 
-    # 2) Priorizar preguntas "no vistas" históricamente por el usuario (en SQLite)
-    seen_by_user = set()
+    # 2) Priorizar preguntas "no vistas" históricamente por el usuario
+    #    (bitset en memoria; de SQLite sólo se leen las interacciones nuevas)
+    seen_by_user = 0
     try:
         # Requiere sesión activa
         uid = session.get("user_id", None)
         if uid is not None:
             con = get_db()
-            rows = con.execute(
-                "SELECT DISTINCT question_id FROM interactions WHERE user_id = ?",
-                (uid,)
-            ).fetchall()
-            con.close()
-            seen_by_user = {int(r["question_id"]) for r in rows}
+            try:
+                seen_by_user = SEEN_CACHE.seen_bits(con, uid)
+            finally:
+                con.close()
     except Exception:
         # Si algo falla, no bloqueamos el flujo (simplemente no priorizamos)
-        seen_by_user = set()
+        seen_by_user = 0
 
-    unseen = [qid for qid in candidates if qid not in seen_by_user]
+    unseen = [qid for qid in candidates if not is_seen(seen_by_user, qid)]
     pool = unseen if unseen else candidates
 
     return random.choice(pool)
@@ -173,7 +222,7 @@ def validate_answer(user_response: str, qid: int):
     if not m:
         return False
     letra = m.group(1).lower()
-    correctas = [r.lower() for r in Preguntas[qid]["res"]]
+    correctas = [r.lower() for r in current_bank().preguntas[qid]["res"]]
     return letra in correctas
 
 # -----------------------------------
@@ -194,7 +243,10 @@ def register():
     if not email.endswith("@uniandes.edu.co"):
         return jsonify({"error": "El correo debe ser @uniandes.edu.co"}), 400
 
-    pwd_hash = generate_password_hash(password)
+    try:
+        pwd_hash = PASSWORD_HASHER.hash(password)
+    except HasherBusy as e:
+        return busy_response(e)
     con = get_db()
     try:
         con.execute("""
@@ -205,15 +257,11 @@ def register():
 
         new_user_id = con.execute("SELECT last_insert_rowid()").fetchone()[0]
         row = con.execute("""
-            SELECT id, full_name, email, uniandes_code, magistral, complementarios, created_at
+            SELECT id, full_name, email, uniandes_code, magistral, complementarios, password_hash, created_at
             FROM users WHERE id = ?
         """, (new_user_id,)).fetchone()
 
-        with open(USERS_CSV, "a", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow([
-                row["id"], row["full_name"], row["email"], row["uniandes_code"],
-                row["magistral"], row["complementarios"], row["created_at"]
-            ])
+        AUDIT_LOG.log_user(row)
     except sqlite3.IntegrityError:
         return jsonify({"error": "Ya existe un usuario con ese correo"}), 409
     finally:
@@ -231,9 +279,21 @@ def login():
     con = get_db()
     row = con.execute("SELECT id, password_hash FROM users WHERE email = ?", (email,)).fetchone()
     con.close()
-    if not row or not check_password_hash(row["password_hash"], password):
+    if not row:
+        return jsonify({"error": "Credenciales inválidas"}), 401
+    # Si cambió PPIA_PASSWORD_METHOD, el hash se rehace en segundo plano (lo agenda el worker)
+    try:
+        ok = PASSWORD_HASHER.verify(
+            row["password_hash"], password,
+            on_rehash=lambda new_hash, uid=row["id"], old=row["password_hash"]: _store_rehash(uid, old, new_hash))
+    except HasherBusy as e:
+        return busy_response(e)
+    if not ok:
         return jsonify({"error": "Credenciales inválidas"}), 401
 
+    # Id de sesión nuevo al autenticarse: uno obtenido antes del login no sirve después
+    if isinstance(app.session_interface, SqliteSessionInterface):
+        app.session_interface.regenerate(session)
     session["user_id"] = int(row["id"])
     # Estado de sesión para el flujo del quiz
     session["user_week"] = None
@@ -244,6 +304,16 @@ def login():
 
     return jsonify({"ok": True})
 
+def _store_rehash(user_id, old_hash, new_hash):
+    con = get_db()
+    try:
+        # Sólo si nadie cambió la contraseña mientras tanto
+        con.execute("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                    (new_hash, user_id, old_hash))
+        con.commit()
+    finally:
+        con.close()
+
 @app.post("/api/logout")
 def logout():
     session.clear()
@@ -275,6 +345,7 @@ def set_week():
         week = 16
 
     session["user_week"] = week
+    current_bank().warm_week(week)  # modo lazy: renderiza en segundo plano lo que verá el estudiante
     return jsonify({"ok": True, "week": week})
 @app.get("/api/themes_difs")
 def themes_difs():
@@ -283,9 +354,14 @@ def themes_difs():
     week = session.get("user_week")
     if week is None:
         return jsonify({"error": "Primero seleccione la semana"}), 400
-    temas = get_available_temas(week)
-    difs = retrieve_difs_for_temas(temas, week)
-    return jsonify({"temas": temas, "difs": difs})
+    # Catálogo precalculado por semana al cargar el banco; el ETag cambia con la
+    # versión del banco, así que el navegador revalida con If-None-Match (304)
+    body, etag = current_bank().catalog(week)
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.vary.add("Cookie")
+    return resp.make_conditional(request)
 
 @app.post("/api/start_quiz")
 def start_quiz():
@@ -308,19 +384,13 @@ def start_quiz():
     session["current_qid"] = None
 
     # Preparar primera pregunta
-    qid = pick_next_question(session["user_week"], theme, difficulty, session["answered_ok_ids"])
+    bank = current_bank()
+    qid = pick_next_question(session["user_week"], theme, difficulty, session["answered_ok_ids"], bank)
     if qid is None:
         return jsonify({"error": "No hay preguntas para los parámetros seleccionados"}), 404
 
     session["current_qid"] = qid
-    q = Preguntas[qid]
-    return jsonify({
-        "question_id": qid,
-        "html": q["enunciado_html"],
-        "tema": q["tema"],
-        "dif": q["dif"],
-        "week": q["week"]
-    })
+    return jsonify(question_ref(bank, qid))
 
 @app.get("/api/question")
 def get_question():
@@ -329,14 +399,43 @@ def get_question():
     qid = session.get("current_qid")
     if not qid:
         return jsonify({"error": "No hay pregunta activa"}), 400
-    q = Preguntas[qid]
-    return jsonify({
-        "question_id": qid,
-        "html": q["enunciado_html"],
-        "tema": q["tema"],
-        "dif": q["dif"],
-        "week": q["week"]
-    })
+    bank = current_bank()
+    if qid not in bank.preguntas:
+        return jsonify({"error": "La pregunta fue retirada del banco; continúa con la siguiente"}), 409
+    return jsonify(question_ref(bank, qid))
+
+def question_ref(bank, qid: int) -> dict:
+    """Lo que devuelven los endpoints del quiz: el contenido se pide aparte a /api/q/<version>/<qid>."""
+    return {"question_id": qid, "version": bank.content_version(qid)}
+
+@app.get("/api/q/<version>/<int:qid>")
+def question_payload(version, qid):
+    """
+    Contenido de una pregunta (html + tema/dif/semana). `version` es la del
+    contenido de esa pregunta (question_ref), así que la URL es inmutable: se
+    sirve precomprimido (br/gzip) con ETag fuerte y caché de un año, y una
+    recarga que no toca la pregunta no la invalida. Si la pregunta cambió
+    desde que se emitió la URL, se sirve el contenido actual sin caché
+    inmutable. No incluye la respuesta, por eso es público.
+    """
+    bank = current_bank()
+    if qid not in bank.preguntas:
+        return jsonify({"error": "La pregunta fue retirada del banco"}), 404
+    p = bank.payload(qid)
+    encoding = request.accept_encodings.best_match([e for e in ("br", "gzip") if e in p.bodies]) or "identity"
+    etag = p.etag if encoding == "identity" else f"{p.etag}-{encoding}"
+    # HTML de respaldo (Pandoc falló): se sirve, pero sin caché inmutable
+    current = version == bank.content_version(qid) and not p.degraded
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "public, max-age=31536000, immutable" if current else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(p.bodies[encoding], mimetype="application/json", headers=headers)
 
 @app.post("/api/answer")
 def answer():
@@ -349,41 +448,32 @@ def answer():
     qid = session.get("current_qid")
     if not qid:
         return jsonify({"error": "No hay pregunta activa"}), 400
+    bank = current_bank()
+    if qid not in bank.preguntas:
+        # Se recargó el banco y esta pregunta ya no existe
+        return jsonify({"error": "La pregunta fue retirada del banco; continúa con la siguiente"}), 409
+
+    ok = record_answer(bank, qid, user_resp)
+    return jsonify(answer_feedback(ok))
+
 
+def record_answer(bank, qid: int, user_resp: str) -> bool:
+    """Valida, registra y aplica la dificultad adaptativa. Devuelve si fue correcta."""
     # 1) Validar respuesta
     ok = validate_answer(user_resp, qid)
 
-    # 2) Persistir interacción en SQLite
-    con = get_db()
-    try:
-        con.execute("""
-            INSERT INTO interactions (user_id, question_id, success, ts)
-            VALUES (?, ?, ?, ?)
-        """, (session["user_id"], qid, 1 if ok else 0, datetime.utcnow().isoformat()))
-        con.commit()
-
-        u = con.execute("SELECT email FROM users WHERE id = ?", (session["user_id"],)).fetchone()
-        email = u["email"] if u else ""
-    finally:
-        con.close()
+    # 2) Persistir interacción en SQLite y en el log de auditoría
+    #    (el escritor en segundo plano las agrupa en una transacción por lote)
+    ANSWER_WRITER.submit(session["user_id"], qid, 1 if ok else 0, datetime.utcnow().isoformat())
+    SEEN_CACHE.mark(session["user_id"], qid)
 
-    # 3) Log en CSV (opcional para auditoría)
-    with open(INTERACTIONS_CSV, "a", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow([
-            datetime.utcnow().isoformat(),
-            session["user_id"],
-            email,
-            qid,
-            1 if ok else 0
-        ])
-
-    # 4) Evitar repetir en esta sesión las preguntas acertadas
+    # 3) Evitar repetir en esta sesión las preguntas acertadas
     if ok:
         answered_ok = set(session.get("answered_ok_ids") or [])
         answered_ok.add(qid)
         session["answered_ok_ids"] = list(answered_ok)
 
-    # 5) --- Dificultad adaptativa (regla 3 de 4) ---
+    # 4) --- Dificultad adaptativa (regla 3 de 4) ---
     # Guardamos las últimas 4 respuestas (1 = acierto, 0 = fallo)
     history = session.get("recent_results", [])
     history.append(1 if ok else 0)
@@ -392,11 +482,8 @@ def answer():
     session["recent_results"] = history
 
     # Ajuste de dificultad según el desempeño reciente
-    # Límites dinámicos: min 1, max = máximo 'dif' presente en el banco
-    try:
-        max_dif_global = max(int(p["dif"]) for p in Preguntas.values())
-    except Exception:
-        max_dif_global = 3  # fallback conservador
+    # Límites dinámicos: min 1, max = máximo 'dif' presente en el banco (precalculado en el índice)
+    max_dif_global = bank.index.max_dif
 
     current_dif = int(session.get("selected_difficulty") or 1)
 
@@ -407,12 +494,32 @@ def answer():
         elif score <= 1 and current_dif > 1:
             current_dif -= 1
         session["selected_difficulty"] = current_dif  # actualizar en sesión
+    return ok
 
-    # 6) Respuesta al front
-    return jsonify({
+
+def answer_feedback(ok: bool) -> dict:
+    """Mensaje para el front tras responder."""
+    return {
         "correct": ok,
         "message": "¡Correcto! ¿Deseas continuar?" if ok else "Incorrecta. ¿Deseas continuar?"
-    })
+    }
+
+
+def advance(bank) -> dict:
+    """Elige la siguiente pregunta y la deja como activa; o {"end": True, ...} si no quedan."""
+    # Buscar otra pregunta del mismo tema, week <=, dif <= seleccionada, no repetida si fue correcta
+    qid = pick_next_question(
+        session["user_week"],
+        session["selected_theme"],
+        session["selected_difficulty"],
+        session.get("answered_ok_ids") or [],
+        bank
+    )
+    if qid is None:
+        return {"end": True, "message": "Terminaste todas las preguntas disponibles para este tema/dificultad."}
+
+    session["current_qid"] = qid
+    return {"end": False, **question_ref(bank, qid)}
 
 
 @app.post("/api/next_question")
@@ -425,96 +532,200 @@ def next_question():
         # Fin: mensaje y opción para volver al dashboard
         return jsonify({"end": True, "message": "¡Gracias por usar la app! Volverás al dashboard."})
 
-    # Buscar otra pregunta del mismo tema, week <=, dif <= seleccionada, no repetida si fue correcta
-    qid = pick_next_question(
-        session["user_week"],
-        session["selected_theme"],
-        session["selected_difficulty"],
-        session.get("answered_ok_ids") or []
-    )
-    if qid is None:
-        return jsonify({"end": True, "message": "Terminaste todas las preguntas disponibles para este tema/dificultad."})
+    return jsonify(advance(current_bank()))
 
-    session["current_qid"] = qid
-    q = Preguntas[qid]
-    return jsonify({
-        "end": False,
-        "question_id": qid,
-        "html": q["enunciado_html"],
-        "tema": q["tema"],
-        "dif": q["dif"],
-        "week": q["week"]
-    })
+
+@app.post("/api/answer_next")
+def answer_next():
+    """
+    /api/answer + /api/next_question en un solo viaje: registra la respuesta
+    y devuelve en "next" la siguiente pregunta (ya activa en la sesión), con
+    la dificultad ajustada por esta misma respuesta. El front puede pedir su
+    contenido a /api/q mientras muestra la retroalimentación.
+    El front manda "question_id" (la pregunta que está mostrando): como la
+    activa ya avanzó, una respuesta repetida o tardía no se califica contra
+    la siguiente (409, y en "next" la pregunta activa de verdad).
+    """
+    if not require_login():
+        return jsonify({"error": "No autenticado"}), 401
+
+    data = request.get_json() or {}
+    user_resp = (data.get("answer") or "").strip()
+
+    qid = session.get("current_qid")
+    if not qid:
+        return jsonify({"error": "No hay pregunta activa"}), 400
+    bank = current_bank()
+    shown = data.get("question_id")
+    if shown is not None and str(shown) != str(qid):
+        return jsonify({"error": "Esa pregunta ya fue respondida; continúa con la siguiente",
+                        "next": {"end": False, **question_ref(bank, qid)}}), 409
+    if qid not in bank.preguntas:
+        # La pregunta ya no existe: no se registra nada, pero se avanza igual
+        return jsonify({"error": "La pregunta fue retirada del banco; continúa con la siguiente",
+                        "next": advance(bank)}), 409
+
+    ok = record_answer(bank, qid, user_resp)
+    return jsonify({**answer_feedback(ok), "next": advance(bank)})
 
 @app.get("/api/history")
 def history():
     if not require_login():
         return jsonify({"error": "No autenticado"}), 401
+    # Paginación por llave: before_id = "next_before_id" de la página anterior.
+    # (user_id, id) sale ordenado de idx_interactions_user, sin ordenar todo el historial.
+    limit = min(max(request.args.get("limit", 200, type=int), 1), 200)
+    before_id = request.args.get("before_id", type=int)
+    ANSWER_WRITER.flush()  # que aparezcan las respuestas aún en cola
     con = get_db()
-    rows = con.execute("""
-        SELECT question_id, success, ts FROM interactions
-        WHERE user_id = ?
-        ORDER BY ts DESC
-        LIMIT 200
-    """, (session["user_id"],)).fetchall()
+    if before_id:
+        rows = con.execute("""
+            SELECT id, question_id, success, ts FROM interactions
+            WHERE user_id = ? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (session["user_id"], before_id, limit)).fetchall()
+    else:
+        rows = con.execute("""
+            SELECT id, question_id, success, ts FROM interactions
+            WHERE user_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (session["user_id"], limit)).fetchall()
     con.close()
     return jsonify({
         "items": [
-            {"question_id": r["question_id"], "success": bool(r["success"]), "ts": r["ts"]}
+            {"id": r["id"], "question_id": r["question_id"], "success": bool(r["success"]), "ts": r["ts"]}
             for r in rows
-        ]
+        ],
+        "next_before_id": rows[-1]["id"] if len(rows) == limit else None
     })
 
-@app.get("/api/export/users_csv")
-def export_users_csv():
+@app.get("/api/dashboard/summary")
+def dashboard_summary():
+    """Totales y dominio por tema del usuario (tablas mantenidas al escribir)."""
     if not require_login():
         return jsonify({"error": "No autenticado"}), 401
+    ANSWER_WRITER.flush()
     con = get_db()
-    rows = con.execute("""
-        SELECT id, full_name, email, uniandes_code, magistral, complementarios, created_at
-        FROM users
-        ORDER BY created_at DESC
-    """).fetchall()
-    con.close()
+    try:
+        data = mastery.summary(con, session["user_id"])
+    finally:
+        con.close()
+    return jsonify(data)
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id","full_name","email","uniandes_code","magistral","complementarios","created_at"])
+@app.get("/api/stats/questions")
+def question_stats():
+    """Intentos, tasa de acierto, tasa al primer intento y ventana reciente por pregunta."""
+    if not require_login():
+        return jsonify({"error": "No autenticado"}), 401
+    qid = request.args.get("question_id", type=int)
+    ANSWER_WRITER.flush()
+    con = get_db()
+    try:
+        rows = item_stats.read_stats(con, qid)
+    finally:
+        con.close()
+    preguntas = current_bank().preguntas
     for r in rows:
-        writer.writerow([r["id"], r["full_name"], r["email"], r["uniandes_code"], r["magistral"], r["complementarios"], r["created_at"]])
+        q = preguntas.get(r["question_id"])
+        if q:
+            r.update(tema=q["tema"], dif=q["dif"], week=q["week"])
+    return jsonify({"items": rows})
+
+def _export_response(sql, params, header, filename, gz):
+    body = stream_csv(DB_POOL, sql, params, header, gz=gz)
+    if gz:
+        return Response(body, mimetype="application/gzip",
+                        headers={"Content-Disposition": f"attachment; filename={filename}.gz"})
+    return Response(body, mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+def _incremental(args):
+    return any(args.get(k) for k in ("after_id", "since", "until", "limit"))
 
-    csv_data = output.getvalue()
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=users.csv"}
-    )
+@app.get("/api/export/users_csv")
+def export_users_csv():
+    """
+    CSV de usuarios en streaming. Filtros opcionales: after_id, since/until
+    (sobre created_at), limit; con ellos el orden es por id ascendente para
+    poder seguir con after_id = último id recibido. gzip=1 comprime.
+    """
+    if not require_login():
+        return jsonify({"error": "No autenticado"}), 401
+    try:
+        where, params, limit = keyset_filters(request.args, "id", "created_at")
+    except ValueError:
+        return jsonify({"error": "Filtros inválidos"}), 400
+    order = "ORDER BY id ASC" if _incremental(request.args) else "ORDER BY created_at DESC"
+    sql = f"""
+        SELECT id, full_name, email, uniandes_code, magistral, complementarios, created_at
+        FROM users
+        {where}
+        {order}
+        {"LIMIT %d" % limit if limit else ""}
+    """
+    header = ["id","full_name","email","uniandes_code","magistral","complementarios","created_at"]
+    return _export_response(sql, params, header, "users.csv", request.args.get("gzip") == "1")
 
 @app.get("/api/export/interactions_csv")
 def export_interactions_csv():
+    """
+    CSV de interacciones en streaming. Con filtros (after_id, since/until sobre
+    ts, limit) se agrega la columna id y el orden es por id ascendente, para
+    descargas incrementales. gzip=1 comprime.
+    """
     if not require_login():
         return jsonify({"error": "No autenticado"}), 401
-    con = get_db()
-    rows = con.execute("""
-        SELECT i.user_id, u.email, i.question_id, i.success, i.ts
+    try:
+        where, params, limit = keyset_filters(request.args, "i.id", "i.ts")
+    except ValueError:
+        return jsonify({"error": "Filtros inválidos"}), 400
+    ANSWER_WRITER.flush()
+    header = ["user_id","email","question_id","success","timestamp"]
+    cols = "i.user_id, u.email, i.question_id, i.success, i.ts"
+    order = "ORDER BY i.ts DESC"
+    if _incremental(request.args):
+        header = ["id"] + header
+        cols = "i.id, " + cols
+        order = "ORDER BY i.id ASC"
+    sql = f"""
+        SELECT {cols}
         FROM interactions i
         JOIN users u ON u.id = i.user_id
-        ORDER BY i.ts DESC
-    """).fetchall()
-    con.close()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["user_id","email","question_id","success","timestamp"])
-    for r in rows:
-        writer.writerow([r["user_id"], r["email"], r["question_id"], int(r["success"]), r["ts"]])
+        {where}
+        {order}
+        {"LIMIT %d" % limit if limit else ""}
+    """
+    return _export_response(sql, params, header, "interactions.csv", request.args.get("gzip") == "1")
 
-    csv_data = output.getvalue()
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=interactions.csv"}
-    )
+# -----------------------------------
+# Administración
+# -----------------------------------
+@app.get("/metrics")
+def metrics_endpoint():
+    """Métricas en formato Prometheus; sólo desde la propia máquina o con el token de admin."""
+    local = request.remote_addr in ("127.0.0.1", "::1")
+    if not metrics.ENABLED:
+        return jsonify({"error": "Métricas deshabilitadas"}), 404
+    if not local and not (ADMIN_TOKEN and request.headers.get("X-Admin-Token") == ADMIN_TOKEN):
+        return jsonify({"error": "No autorizado"}), 403
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.post("/api/admin/reload_bank")
+def admin_reload_bank():
+    """
+    Relee Preguntas.tex y re-renderiza sólo lo nuevo/modificado, sin reiniciar.
+    Con varios workers, sólo recarga el que atiende este request: para todos,
+    usar PPIA_BANK_WATCH.
+    """
+    if not ADMIN_TOKEN or request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "No autorizado"}), 403
+    try:
+        diff = reload_bank("Preguntas.tex")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"ok": True, **diff})
 
 # -----------------------------------
 # Archivos estáticos del Front e imágenes del Back
@@ -532,10 +743,46 @@ def serve_front(path):
     return send_from_directory(FRONT_DIR, "index.html")
 
 
+# -----------------------------------
+# Arranque
+# -----------------------------------
+_initialized = False
+
+def create_app(background: bool = True):
+    """
+    Prepara la app (una vez por proceso) y la devuelve: esquema de la base y
+    banco de preguntas con sus índices. Con gunicorn (preload_app, ver
+    wsgi.py) esto corre sólo en el master y los workers heredan el banco
+    por copy-on-write; los hilos de fondo se arrancan en cada worker con
+    start_background() (hook post_fork), no en el master.
+    """
+    global _initialized
+    if not _initialized:
+        ensure_schema()
+        # Banco precompilado (Preguntas.bank.sqlite); se reconstruye solo si el .tex cambió.
+        # Con PPIA_BANK_LAZY=1 sólo se cargan metadatos y el HTML se obtiene con bank.html(qid).
+        # Siempre se accede vía current_bank(): la recarga en caliente lo reemplaza.
+        install_bank(load_question_bank("Preguntas.tex"))
+        # Que ningún worker herede conexiones SQLite abiertas por el master
+        DB_POOL.close_all()
+        if isinstance(app.session_interface, SqliteSessionInterface):
+            app.session_interface.pool.close_all()
+        _initialized = True
+    if background:
+        start_background()
+    return app
+
+def start_background():
+    """Hilos de fondo del proceso (el escritor de respuestas arranca solo al primer uso)."""
+    if BANK_WATCH_INTERVAL > 0:
+        watch_bank("Preguntas.tex", BANK_WATCH_INTERVAL, logger=app.logger)
+
+
 if __name__ == "__main__":
     import os
     # Usa el puerto que ponga Render si existiera; 5000 para local
     port = int(os.environ.get("PORT", "5000"))
     # Activa debug sólo si FLASK_DEBUG=1 (útil en local)
     debug = os.environ.get("FLASK_DEBUG", "0") == "1"
+    create_app()
     app.run(host="0.0.0.0", port=port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,253 @@
+# audit_log.py
+# -*- coding: utf-8 -*-
+"""
+Log de auditoría de registros y respuestas (reemplaza users.csv e
+interactions.csv como espejo de la base).
+
+- Formato: JSON por línea, {"t": "user", ...} o {"t": "answer", ...}; cada
+  archivo empieza con {"t": "segment", "opened": <epoch>} (para la rotación
+  por tiempo).
+- Cada llamada a append() escribe todas sus líneas de una vez, con el
+  archivo abierto en modo append y un flock exclusivo sobre audit.lock, así
+  que varios workers de gunicorn no intercalan líneas.
+- Rotación: cuando el archivo activo supera PPIA_AUDIT_MAX_BYTES o tiene más
+  de PPIA_AUDIT_ROTATE_S segundos, se renombra (bajo el lock) y se comprime
+  con gzip fuera del lock: audit-<fecha>-<pid>.jsonl.gz. El tamaño sale del
+  fstat del mismo descriptor con el que se escribe, y la hora de apertura
+  del encabezado se lee una sola vez por segmento (se recuerda por inodo).
+- El hash de la contraseña NO se escribe (estos archivos se guardan y se
+  copian): sólo con PPIA_AUDIT_PASSWORD_HASH=1. Sin él, `rebuild` deja a
+  los usuarios sin contraseña válida y hay que restablecerlas.
+
+Herramienta de replay:
+    python audit_log.py verify [--db quiz.db]    # compara el log con la base
+    python audit_log.py rebuild --db nueva.db    # reconstruye las tablas desde el log
+"""
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo queda el lock entre hilos
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIT_DIR = os.environ.get("PPIA_AUDIT_DIR", os.path.join(BASE_DIR, "audit"))
+MAX_BYTES = int(os.environ.get("PPIA_AUDIT_MAX_BYTES", str(16 * 1024 * 1024)))
+ROTATE_S = float(os.environ.get("PPIA_AUDIT_ROTATE_S", "86400"))
+
+# El hash de la contraseña sólo va al log si se pide explícitamente
+INCLUDE_PASSWORD_HASH = os.environ.get("PPIA_AUDIT_PASSWORD_HASH", "0") == "1"
+
+ACTIVE_NAME = "audit.jsonl"
+# Columnas de users; las que van al log son AUDIT_USER_FIELDS
+USER_FIELDS = ("id", "full_name", "email", "uniandes_code", "magistral", "complementarios",
+               "password_hash", "created_at")
+AUDIT_USER_FIELDS = tuple(k for k in USER_FIELDS if k != "password_hash" or INCLUDE_PASSWORD_HASH)
+
+
+class AuditLog:
+    def __init__(self, directory=AUDIT_DIR, max_bytes=MAX_BYTES, rotate_s=ROTATE_S, logger=None):
+        self.directory = directory
+        self.logger = logger or logging.getLogger(__name__)
+        self.path = os.path.join(directory, ACTIVE_NAME)
+        self.lock_path = os.path.join(directory, "audit.lock")
+        self.max_bytes = max_bytes
+        self.rotate_s = rotate_s
+        self._thread_lock = threading.Lock()
+        self.records = 0
+        self.rotations = 0
+        self._segment = (None, 0.0)  # (inodo del archivo activo, hora de apertura)
+        os.makedirs(directory, exist_ok=True)
+
+    def log_user(self, row):
+        """row: fila de users (sqlite3.Row o dict) con AUDIT_USER_FIELDS."""
+        self.append([dict({"t": "user"}, **{k: row[k] for k in AUDIT_USER_FIELDS})])
+
+    def log_answers(self, rows):
+        """rows: [(user_id, question_id, success, ts), ...] (un lote del escritor)."""
+        self.append([
+            {"t": "answer", "user_id": u, "question_id": q, "success": s, "ts": ts}
+            for u, q, s, ts in rows
+        ])
+
+    def append(self, records):
+        if not records:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n"
+                       for r in records).encode("utf-8")
+        rotated = None
+        with self._thread_lock:
+            lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+                fd = self._open_active()
+                try:
+                    rotated = self._maybe_rotate(fd)
+                    if rotated:
+                        os.close(fd)
+                        fd = self._open_active()
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            finally:
+                os.close(lock_fd)  # libera el flock
+            self.records += len(records)
+        if rotated:
+            self._compress(rotated)
+
+    def _open_active(self) -> int:
+        """Con el lock tomado: abre el archivo activo (si es nuevo, con su encabezado)."""
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        st = os.fstat(fd)
+        if st.st_size == 0:
+            opened = time.time()
+            os.write(fd, json.dumps({"t": "segment", "opened": opened}).encode("utf-8") + b"\n")
+            self._segment = (st.st_ino, opened)
+        return fd
+
+    def _maybe_rotate(self, fd):
+        """Con el lock tomado: renombra el archivo activo si toca rotar (devuelve el nombre nuevo)."""
+        st = os.fstat(fd)
+        too_big = st.st_size >= self.max_bytes
+        too_old = False
+        if self.rotate_s > 0:
+            if self._segment[0] != st.st_ino:
+                # Segmento abierto por otro proceso (o por un arranque anterior)
+                self._segment = (st.st_ino, _opened_at(self.path, st))
+            too_old = time.time() - self._segment[1] >= self.rotate_s
+            if too_old and not too_big:
+                # El inodo pudo reutilizarse tras otra rotación: se confirma con el encabezado
+                self._segment = (st.st_ino, _opened_at(self.path, st))
+                too_old = time.time() - self._segment[1] >= self.rotate_s
+        if not (too_big or too_old):
+            return None
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        target = os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}.jsonl")
+        os.rename(self.path, target)
+        self.rotations += 1
+        return target
+
+    def _compress(self, path):
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(path + ".gz.tmp", path + ".gz")
+            os.remove(path)
+        except OSError as e:
+            self.logger.error("audit_log: no se pudo comprimir %s: %s", path, e)
+
+    def stats(self) -> dict:
+        return {"dir": self.directory, "records": self.records, "rotations": self.rotations}
+
+
+def _opened_at(path, st) -> float:
+    # Hora de apertura del archivo activo según su encabezado (o mtime si no lo tiene)
+    try:
+        with open(path, "rb") as f:
+            return float(json.loads(f.readline())["opened"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return st.st_mtime
+
+
+# ---------------------------
+# Lectura / replay
+# ---------------------------
+def segments(directory=AUDIT_DIR):
+    """Archivos del log en orden: rotados (por nombre = fecha) y luego el activo."""
+    rotated = sorted(glob.glob(os.path.join(directory, "audit-*.jsonl.gz")) +
+                     glob.glob(os.path.join(directory, "audit-*.jsonl")))
+    active = os.path.join(directory, ACTIVE_NAME)
+    return rotated + ([active] if os.path.isfile(active) else [])
+
+
+def iter_records(directory=AUDIT_DIR):
+    for path in segments(directory):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Última línea a medio escribir (p. ej. corte de luz)
+                    print(f"audit_log: línea inválida en {os.path.basename(path)}:{n}", file=sys.stderr)
+
+
+def _read_log(directory):
+    users, answers = {}, Counter()
+    for rec in iter_records(directory):
+        if rec.get("t") == "user":
+            users[rec["id"]] = rec
+        elif rec.get("t") == "answer":
+            answers[(rec["user_id"], rec["question_id"], rec["success"], rec["ts"])] += 1
+    return users, answers
+
+
+def verify(db_path, directory=AUDIT_DIR) -> int:
+    """Compara users/interactions de la base con el log. Devuelve el número de diferencias."""
+    users, answers = _read_log(directory)
+    con = sqlite3.connect(db_path)
+    db_users = {r[0]: r for r in con.execute("SELECT id, email FROM users")}
+    db_answers = Counter(con.execute("SELECT user_id, question_id, success, ts FROM interactions"))
+    con.close()
+
+    missing_users = sorted(set(users) - set(db_users))
+    extra_users = sorted(set(db_users) - set(users))
+    missing_answers = answers - db_answers
+    extra_answers = db_answers - answers
+    print(f"log:  {len(users)} usuarios, {sum(answers.values())} respuestas")
+    print(f"base: {len(db_users)} usuarios, {sum(db_answers.values())} respuestas")
+    print(f"usuarios sólo en el log: {len(missing_users)}  sólo en la base: {len(extra_users)}")
+    print(f"respuestas sólo en el log: {sum(missing_answers.values())}  "
+          f"sólo en la base: {sum(extra_answers.values())}")
+    for row in list(missing_answers)[:10]:
+        print("  falta en la base:", row)
+    return len(missing_users) + len(extra_users) + sum(missing_answers.values()) + sum(extra_answers.values())
+
+
+def rebuild(db_path, directory=AUDIT_DIR):
+    """Crea db_path (no debe existir) con el esquema de db_init y lo llena desde el log."""
+    import db_init
+
+    if os.path.exists(db_path):
+        raise SystemExit(f"{db_path} ya existe; usa otro nombre")
+    users, answers = _read_log(directory)
+    con = sqlite3.connect(db_path)
+    db_init.init_schema(con)
+    with con:
+        con.executemany(
+            f"INSERT INTO users ({', '.join(USER_FIELDS)}) VALUES ({', '.join('?' * len(USER_FIELDS))})",
+            [tuple(u.get(k, "") for k in USER_FIELDS) for _, u in sorted(users.items())]
+        )
+        rows = sorted(answers.elements(), key=lambda r: r[3])
+        con.executemany("INSERT INTO interactions (user_id, question_id, success, ts) VALUES (?, ?, ?, ?)", rows)
+    con.close()
+    print(f"Reconstruida {db_path}: {len(users)} usuarios, {len(rows)} respuestas")
+    without_hash = sum(1 for u in users.values() if not u.get("password_hash"))
+    if without_hash:
+        print(f"{without_hash} usuarios sin hash de contraseña en el log: deben restablecerla")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replay del log de auditoría")
+    ap.add_argument("command", choices=("verify", "rebuild"))
+    ap.add_argument("--db", default=os.environ.get("PPIA_DB_PATH", os.path.join(BASE_DIR, "quiz.db")))
+    ap.add_argument("--dir", default=AUDIT_DIR)
+    args = ap.parse_args()
+    if args.command == "verify":
+        sys.exit(1 if verify(args.db, args.dir) else 0)
+    rebuild(args.db, args.dir)
@@ -0,0 +1,243 @@
+# bank_artifact.py
+# -*- coding: utf-8 -*-
+"""
+Banco de preguntas precompilado.
+
+`python bank_artifact.py` convierte Preguntas.tex en un archivo SQLite
+(Preguntas.bank.sqlite) con los metadatos y el HTML ya renderizado. Al
+arrancar, app.py lee ese archivo en vez de parsear y renderizar el .tex;
+si el hash del .tex no coincide con el guardado, se reconstruye solo.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+import preguntas_loader
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Subir este número cuando cambie el formato o la forma de generar el HTML
+ARTIFACT_FORMAT = 2
+
+# Cuánto del archivo se mapea en memoria al leerlo
+MMAP_SIZE = 64 * 1024 * 1024
+
+
+def artifact_path(tex_path: str) -> str:
+    """Preguntas.tex -> Preguntas.bank.sqlite (junto al banco)."""
+    return os.path.splitext(tex_path)[0] + ".bank.sqlite"
+
+
+def source_hash(tex_path: str) -> str:
+    """Hash del .tex + formato del artefacto + flags y versión de Pandoc."""
+    h = hashlib.sha256()
+    h.update(f"format={ARTIFACT_FORMAT};flags={' '.join(preguntas_loader.PANDOC_FLAGS)};"
+             f"pandoc={preguntas_loader.pandoc_version()}\0".encode("utf-8"))
+    with open(tex_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def resolve_tex_path(tex_name: str) -> str:
+    return tex_name if os.path.isabs(tex_name) else os.path.join(BASE_DIR, tex_name)
+
+
+def degraded_questions(preguntas: dict):
+    """qids cuyo HTML salió del fallback sin Pandoc."""
+    return [qid for qid, q in preguntas.items() if preguntas_loader.has_fallback(q["enunciado_html"])]
+
+
+def write_artifact(preguntas: dict, path: str, src_hash: str, hashes: dict) -> bool:
+    """
+    Escribe el artefacto de forma atómica (archivo temporal + rename).
+    hashes: qid -> hash del bloque en el .tex (para la recarga incremental).
+    No escribe nada (devuelve False) si alguna pregunta quedó con el HTML de
+    respaldo de Pandoc: así el próximo arranque vuelve a intentar renderizar
+    en vez de dar por bueno ese HTML.
+    """
+    if degraded_questions(preguntas):
+        return False
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    con = sqlite3.connect(tmp)
+    try:
+        con.executescript("""
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE questions (
+            id INTEGER PRIMARY KEY,
+            tema TEXT NOT NULL,
+            dif INTEGER NOT NULL,
+            res TEXT NOT NULL,
+            week INTEGER NOT NULL,
+            opts TEXT NOT NULL,
+            enunciado_html TEXT NOT NULL,
+            src_hash TEXT NOT NULL
+        );
+        """)
+        con.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("format", str(ARTIFACT_FORMAT)),
+            ("source_hash", src_hash),
+            ("pandoc_version", preguntas_loader.pandoc_version()),
+            ("questions", str(len(preguntas))),
+        ])
+        con.executemany("""
+            INSERT INTO questions (id, tema, dif, res, week, opts, enunciado_html, src_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (qid, q["tema"], q["dif"], json.dumps(q["res"], ensure_ascii=False), q["week"],
+             json.dumps(q["opts"], ensure_ascii=False), q["enunciado_html"], hashes.get(qid, ""))
+            for qid, q in preguntas.items()
+        ])
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, path)
+    return True
+
+
+def build_artifact(tex_name: str = "Preguntas.tex", path=None) -> dict:
+    """Parsea y renderiza el .tex y guarda el artefacto. Devuelve el dict Preguntas."""
+    tex_path = resolve_tex_path(tex_name)
+    path = path or artifact_path(tex_path)
+    src_hash = source_hash(tex_path)
+    preguntas = preguntas_loader.load_preguntas_from_latex(tex_path)
+    write_artifact(preguntas, path, src_hash, preguntas_loader.question_hashes(tex_path))
+    return preguntas
+
+
+def open_artifact(path: str):
+    """Conexión de sólo lectura con el archivo mapeado en memoria."""
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    con.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    return con
+
+
+def artifact_hash(path: str):
+    """source_hash guardado en el artefacto (None si no existe o es ilegible)."""
+    if not os.path.isfile(path):
+        return None
+    try:
+        con = open_artifact(path)
+        try:
+            rows = dict(con.execute("SELECT key, value FROM meta").fetchall())
+        finally:
+            con.close()
+    except sqlite3.Error:
+        return None
+    if rows.get("format") != str(ARTIFACT_FORMAT):
+        return None
+    return rows.get("source_hash")
+
+
+def load_artifact(path: str) -> dict:
+    """Lee el artefacto completo al formato de preguntas_loader.Preguntas."""
+    con = open_artifact(path)
+    try:
+        rows = con.execute("""
+            SELECT id, tema, dif, res, week, opts, enunciado_html
+            FROM questions ORDER BY id
+        """).fetchall()
+    finally:
+        con.close()
+    return {
+        qid: {
+            "tema": tema,
+            "dif": dif,
+            "res": json.loads(res),
+            "week": week,
+            "enunciado_html": html,
+            "opts": json.loads(opts),
+        }
+        for qid, tema, dif, res, week, opts, html in rows
+    }
+
+
+def load_artifact_meta(path: str) -> dict:
+    """Igual que load_artifact pero sin 'enunciado_html' (modo lazy)."""
+    con = open_artifact(path)
+    try:
+        rows = con.execute("SELECT id, tema, dif, res, week, opts FROM questions ORDER BY id").fetchall()
+    finally:
+        con.close()
+    return {
+        qid: {"tema": tema, "dif": dif, "res": json.loads(res), "week": week, "opts": json.loads(opts)}
+        for qid, tema, dif, res, week, opts in rows
+    }
+
+
+def load_hashes(path: str) -> dict:
+    """qid -> hash del bloque fuente guardado en el artefacto ({} si no se puede leer)."""
+    try:
+        con = open_artifact(path)
+        try:
+            return dict(con.execute("SELECT id, src_hash FROM questions").fetchall())
+        finally:
+            con.close()
+    except sqlite3.Error:
+        return {}
+
+
+def artifact_html(con, qid: int):
+    """HTML de una pregunta leído directo del artefacto (None si no está)."""
+    row = con.execute("SELECT enunciado_html FROM questions WHERE id = ?", (qid,)).fetchone()
+    return row[0] if row else None
+
+
+def is_fresh(tex_name: str = "Preguntas.tex") -> bool:
+    tex_path = resolve_tex_path(tex_name)
+    return artifact_hash(artifact_path(tex_path)) == source_hash(tex_path)
+
+
+def load_bank(tex_name: str = "Preguntas.tex") -> dict:
+    """
+    Devuelve Preguntas desde el artefacto. Si falta o está desactualizado
+    respecto al .tex, lo reconstruye (y si no se puede escribir, igual
+    devuelve el banco recién cargado).
+    """
+    return load_bank_and_hashes(tex_name)[0]
+
+
+def load_bank_and_hashes(tex_name: str = "Preguntas.tex"):
+    """
+    Como load_bank, pero devuelve (Preguntas, hashes por pregunta) del .tex
+    que realmente se cargó. Los hashes del artefacto sólo se usan si su
+    source_hash coincide con el .tex actual; si no, se calculan del .tex
+    (el artefacto viejo puede quedar en disco si no se pudo reescribir).
+    """
+    tex_path = resolve_tex_path(tex_name)
+    path = artifact_path(tex_path)
+    src_hash = source_hash(tex_path)
+    if artifact_hash(path) == src_hash:
+        hashes = load_hashes(path)
+        if hashes:
+            return load_artifact(path), hashes
+    preguntas = preguntas_loader.load_preguntas_from_latex(tex_path)
+    hashes = preguntas_loader.question_hashes(tex_path)
+    try:
+        write_artifact(preguntas, path, src_hash, hashes)
+    except (OSError, sqlite3.Error):
+        # Imagen de sólo lectura: seguimos con el banco recién cargado
+        pass
+    return preguntas, hashes
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    tex = args[0] if args else "Preguntas.tex"
+    out = artifact_path(resolve_tex_path(tex))
+    if "--check" in sys.argv:
+        fresh = artifact_hash(out) == source_hash(resolve_tex_path(tex))
+        print("Artefacto al día" if fresh else "Artefacto desactualizado", out)
+        sys.exit(0 if fresh else 1)
+    bank = build_artifact(tex, out)
+    for line, msg in preguntas_loader.PARSE_ISSUES:
+        print(f"  {tex}:{line}: {msg}")
+    degraded = degraded_questions(bank)
+    if degraded:
+        print(f"Pandoc falló en {len(degraded)} preguntas (p. ej. {degraded[:5]}); no se escribió", out)
+        sys.exit(1)
+    print(f"{len(bank)} preguntas compiladas en", out)
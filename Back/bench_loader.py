@@ -0,0 +1,278 @@
+# bench_loader.py
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks del banco de preguntas sobre bancos sintéticos escalados.
+
+Genera bancos de 1x, 10x y 100x el tamaño real (repitiendo los bloques con
+ids nuevos) y mide, por escala:
+  split      tokenizador de preguntas_loader vs. el regex de archivo
+             completo que se usaba antes (en las filas "+q", también el
+             parseo de cada pregunta)
+  loader     load_preguntas_from_latex por fase (parse / render, y render
+             por fragmento), sanitize_latex_fragment y canon_tema
+  selection  pick_next_question, get_available_temas,
+             retrieve_difs_for_temas y validate_answer de app.py sobre el
+             banco escalado
+Pandoc se reemplaza por un stub en el mismo proceso (y el caché de
+renderizado se apaga), así que corre sin Pandoc instalado y el render mide
+sólo el costo propio del loader: lotes, separación y ensamble.
+
+    python bench_loader.py                          # todo, escalas 1,10,100
+    python bench_loader.py --suites loader --scales 1,10 --repeat 5
+    python bench_loader.py --json bench.json        # para comparar entre commits
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from html import escape
+
+import preguntas_loader
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BANK_PATH = os.path.join(BASE_DIR, "Preguntas.tex")
+
+# Regex original (referencia para comparar)
+LEGACY_PATTERN = r"\\begin\{question\}\{(\d+)\}\{([^\}]+)\}\{(\d+)\}\{([^\}]+)\}\{(\d+)\}\{([\s\S]+?)\}\s*\\end\{question\}"
+
+
+def make_scaled_bank(scale: int, out_dir: str) -> str:
+    """
+    Escribe un banco con `scale` copias de cada pregunta (ids renumerados).
+    Los bloques salen del mismo tokenizador que usa el loader
+    (iter_question_blocks), así que el banco escalado tiene exactamente las
+    preguntas que producción cargaría, multiplicadas.
+    """
+    with open(BANK_PATH, "r", encoding="utf-8") as f:
+        groups = [g for _, g in preguntas_loader.iter_question_blocks(f)]
+    path = os.path.join(out_dir, f"Preguntas_x{scale}.tex")
+    next_id = 1
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(scale):
+            for _, tema, dif, res, week, body in groups:
+                f.write("\\begin{question}{%d}{%s}{%s}{%s}{%s}{%s}\n\\end{question}"
+                        % (next_id, tema, dif, res, week, body))
+                f.write("\n\n% ------------------------------\n\n")
+                next_id += 1
+    return path
+
+
+def parse_legacy(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    return [preguntas_loader._parse_question(*m) for m in re.findall(LEGACY_PATTERN, content, re.DOTALL)]
+
+
+def parse_streaming(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [preguntas_loader._parse_question(*g) for _, g in preguntas_loader.iter_question_blocks(f)]
+
+
+def split_legacy(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return re.findall(LEGACY_PATTERN, f.read(), re.DOTALL)
+
+
+def split_streaming(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return list(preguntas_loader.iter_question_blocks(f))
+
+
+def timeit(fn, path, repeat):
+    times, n = [], 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        n = len(fn(path))
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), n
+
+
+def time_calls(fn, calls, repeat):
+    """Mediana (entre repeticiones) de µs por llamada de fn(*args) sobre `calls`."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for args in calls:
+            fn(*args)
+        times.append(time.perf_counter() - t0)
+    return 1e6 * statistics.median(times) / max(len(calls), 1)
+
+
+# ---------------------------
+# Pandoc simulado
+# ---------------------------
+def fake_pandoc(src: str) -> str:
+    """Un <p> por párrafo, como Pandoc con texto plano (respeta los separadores de lote)."""
+    return "".join(f"<p>{escape(p.strip(), quote=False)}</p>\n"
+                   for p in re.split(r"\n\s*\n", src) if p.strip())
+
+
+@contextmanager
+def stubbed_pandoc():
+    """Pandoc en proceso y sin caché de renderizado mientras dura el bloque."""
+    run_pandoc = preguntas_loader._run_pandoc
+    cache_env = os.environ.get("PPIA_RENDER_CACHE")
+    preguntas_loader._run_pandoc = fake_pandoc
+    os.environ["PPIA_RENDER_CACHE"] = "0"
+    try:
+        yield
+    finally:
+        preguntas_loader._run_pandoc = run_pandoc
+        if cache_env is None:
+            os.environ.pop("PPIA_RENDER_CACHE", None)
+        else:
+            os.environ["PPIA_RENDER_CACHE"] = cache_env
+
+
+def raw_fragments(path: str):
+    """(temas crudos, fragmentos LaTeX sin sanitizar) del banco, como los ve _parse_question."""
+    temas, fragments = [], []
+    for groups in split_streaming_groups(path):
+        temas.extend(t for t in groups[1].split(","))
+        body = groups[5]
+        enum_match = preguntas_loader._ENUM_RE.search(body)
+        if enum_match:
+            fragments.extend(t for _, t, _ in preguntas_loader._ITEM_RE.findall(enum_match.group(1)))
+        fragments.append(preguntas_loader._ENUM_RE.sub("", body).strip())
+    return temas, fragments
+
+
+def split_streaming_groups(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [g for _, g in preguntas_loader.iter_question_blocks(f)]
+
+
+# ---------------------------
+# Suites
+# ---------------------------
+def bench_split(scale, path, repeat, results):
+    for name, fn in (("regex", split_legacy), ("streaming", split_streaming),
+                     ("regex+q", parse_legacy), ("stream+q", parse_streaming)):
+        t, n = timeit(fn, path, repeat)
+        results.append({"suite": "split", "scale": scale, "name": name, "n": n,
+                        "seconds": t, "us_per_item": 1e6 * t / max(n, 1)})
+
+
+def bench_loader(scale, path, repeat, results):
+    phases = {"parse": [], "render": [], "total": []}
+    with stubbed_pandoc():
+        for _ in range(repeat):
+            preguntas = preguntas_loader.load_preguntas_from_latex(path, workers=1)
+            stats = preguntas_loader.LOAD_STATS
+            phases["parse"].append(stats["parse_s"])
+            phases["render"].append(stats["render_s"])
+            phases["total"].append(stats["total_s"])
+    n = len(preguntas)
+    fragments = stats["workers"][0]["fragments"]
+    for name in ("parse", "render", "total"):
+        t = statistics.median(phases[name])
+        results.append({"suite": "loader", "scale": scale, "name": name, "n": n,
+                        "seconds": t, "us_per_item": 1e6 * t / max(n, 1)})
+    t = statistics.median(phases["render"])
+    results.append({"suite": "loader", "scale": scale, "name": "render/frag", "n": fragments,
+                    "seconds": t, "us_per_item": 1e6 * t / max(fragments, 1)})
+
+    temas, fragments = raw_fragments(path)
+    for name, fn, calls in (("sanitize", preguntas_loader.sanitize_latex_fragment, [(s,) for s in fragments]),
+                            ("canon_tema", preguntas_loader.canon_tema, [(t,) for t in temas])):
+        us = time_calls(fn, calls, repeat)
+        results.append({"suite": "loader", "scale": scale, "name": name, "n": len(calls),
+                        "seconds": us * len(calls) / 1e6, "us_per_item": us})
+
+
+def bench_selection(scale, path, repeat, results, calls=2000):
+    quiz_app = _import_app()
+    from question_bank import QuestionBank, install_bank, current_bank
+
+    with stubbed_pandoc():
+        preguntas = preguntas_loader.load_preguntas_from_latex(path, workers=1)
+    previous = current_bank()
+    install_bank(QuestionBank(preguntas))
+    index = current_bank().index
+    rng = random.Random(scale)
+    qids = list(preguntas)
+    all_temas = index.temas_for_week(16)
+
+    weeks = [rng.randint(1, 16) for _ in range(calls)]
+    tema_sets = [rng.sample(all_temas, min(len(all_temas), rng.randint(1, 3))) for _ in range(calls)]
+    picks = [(w, ", ".join(ts), index.max_dif, rng.sample(qids, min(len(qids), 20)))
+             for w, ts in zip(weeks, tema_sets)]
+    answers = [(rng.choice(("a", "B", "(c)", "d) porque...")), rng.choice(qids)) for _ in range(calls)]
+
+    try:
+        # pick_next_question consulta el caché de vistas del usuario de la sesión
+        with quiz_app.app.test_request_context("/", base_url="https://localhost"):
+            quiz_app.session["user_id"] = 1
+            for name, fn, args in (
+                ("pick_next_question", quiz_app.pick_next_question, picks),
+                ("get_available_temas", quiz_app.get_available_temas, [(w,) for w in weeks]),
+                ("retrieve_difs_for_temas", quiz_app.retrieve_difs_for_temas,
+                 list(zip(tema_sets, weeks))),
+                ("validate_answer", quiz_app.validate_answer, answers),
+            ):
+                us = time_calls(fn, args, repeat)
+                results.append({"suite": "selection", "scale": scale, "name": name, "n": len(preguntas),
+                                "seconds": us * len(args) / 1e6, "us_per_item": us})
+    finally:
+        install_bank(previous)
+
+
+_app_tmp = None
+
+
+def _import_app():
+    """Importa app.py con base, sesiones y auditoría en un directorio temporal."""
+    global _app_tmp
+    if _app_tmp is None:
+        _app_tmp = tempfile.TemporaryDirectory(prefix="ppia-bench-")
+        os.environ.setdefault("PPIA_DB_PATH", os.path.join(_app_tmp.name, "quiz.db"))
+        os.environ.setdefault("PPIA_SESSION_DB", os.path.join(_app_tmp.name, "sessions.db"))
+        os.environ.setdefault("PPIA_AUDIT_DIR", os.path.join(_app_tmp.name, "audit"))
+    import app as quiz_app
+    quiz_app.ensure_schema()
+    return quiz_app
+
+
+SUITES = {"split": bench_split, "loader": bench_loader, "selection": bench_selection}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="1,10,100")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--suites", default=",".join(SUITES), help="split,loader,selection")
+    ap.add_argument("--json", help="guardar los resultados en este archivo JSON")
+    args = ap.parse_args(argv)
+    scales = [int(x) for x in args.scales.split(",")]
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        ap.error("suites desconocidas: " + ", ".join(sorted(unknown)))
+
+    results = []
+    print(f"{'suite':>9} {'escala':>7} {'n':>9} {'medición':>24} {'mediana (s)':>12} {'µs/ítem':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            path = make_scaled_bank(scale, tmp)
+            for suite in suites:
+                start = len(results)
+                SUITES[suite](scale, path, args.repeat, results)
+                for r in results[start:]:
+                    print(f"{r['suite']:>9} {r['scale']:>6}x {r['n']:>9} {r['name']:>24} "
+                          f"{r['seconds']:>12.4f} {r['us_per_item']:>10.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"scales": scales, "repeat": args.repeat, "results": results}, f, indent=2)
+        print("Resultados en", args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# csv_export.py
+# -*- coding: utf-8 -*-
+"""
+Exportaciones CSV en streaming (las usan /api/export/*).
+
+Cada descarga usa una conexión dedicada (pool.reader()), no una del pool de
+requests: un cliente lento no deja a la app sin conexiones. Se abre antes de
+empezar la respuesta, así que si no hay cupo el request recibe un 503
+(PoolTimeout) en vez de un CSV cortado.
+
+Las filas se leen con fetchmany dentro de una transacción de lectura: con
+WAL eso es una foto consistente de la base al momento del primer SELECT y
+no bloquea a los escritores (las respuestas siguen guardándose mientras
+se descarga). El CSV se genera por bloques, opcionalmente comprimido con
+gzip, así que la memoria no depende del tamaño de la tabla.
+"""
+import csv
+import io
+import zlib
+
+FETCH_ROWS = 1000
+
+
+class CsvStream:
+    """Iterable de la respuesta; el servidor llama close() al terminar o si el cliente corta."""
+
+    def __init__(self, con, chunks):
+        self._con = con
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self._chunks.close()
+        self._con.close()  # también si la respuesta nunca empezó a enviarse
+
+
+def stream_csv(pool, sql: str, params, header, gz: bool = False, fetch_rows: int = FETCH_ROWS):
+    """Bytes de header + filas de `sql`, en CSV (y gzip si gz). PoolTimeout si no hay cupo."""
+    con = pool.reader()
+    return CsvStream(con, _csv_chunks(con, sql, params, header, gz, fetch_rows))
+
+
+def _csv_chunks(con, sql, params, header, gz, fetch_rows):
+    try:
+        con.execute("BEGIN")  # la foto se fija con el primer SELECT
+        cur = con.execute(sql, params)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        packer = zlib.compressobj(6, zlib.DEFLATED, 31) if gz else None  # 31 = formato gzip
+
+        def chunk():
+            data = buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+            return packer.compress(data) if packer else data
+
+        writer.writerow(header)
+        while True:
+            rows = cur.fetchmany(fetch_rows)
+            if not rows:
+                break
+            writer.writerows(rows)
+            out = chunk()
+            if out:
+                yield out
+        out = chunk()
+        if packer:
+            out += packer.flush()
+        if out:
+            yield out
+    finally:
+        # También si el cliente corta la descarga (el servidor cierra el generador)
+        con.close()
+
+
+def keyset_filters(args, id_col: str, ts_col: str):
+    """
+    Filtros incrementales desde los query params:
+      after_id  -> id_col > after_id   (paginación por llave: seguir desde el último id)
+      since     -> ts_col >= since     (ISO 8601, como se guardan los ts)
+      until     -> ts_col <  until
+      limit     -> máximo de filas
+    Devuelve (cláusula WHERE o "", parámetros, limit o None). ValueError si algo no es válido.
+    """
+    where, params = [], []
+    if args.get("after_id"):
+        where.append(f"{id_col} > ?")
+        params.append(int(args["after_id"]))
+    if args.get("since"):
+        where.append(f"{ts_col} >= ?")
+        params.append(args["since"])
+    if args.get("until"):
+        where.append(f"{ts_col} < ?")
+        params.append(args["until"])
+    limit = int(args["limit"]) if args.get("limit") else None
+    if limit is not None and limit <= 0:
+        raise ValueError("limit debe ser positivo")
+    return ("WHERE " + " AND ".join(where)) if where else "", params, limit
@@ -3,7 +3,10 @@
 import sqlite3
 import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "quiz.db")
+import item_stats
+import mastery
+
+DB_PATH = os.environ.get("PPIA_DB_PATH", os.path.join(os.path.dirname(__file__), "quiz.db"))
 
 schema = """
 PRAGMA journal_mode=WAL;
@@ -29,13 +32,22 @@ CREATE TABLE IF NOT EXISTS interactions (
 );
 
 CREATE INDEX IF NOT EXISTS idx_interactions_user ON interactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_interactions_ts ON interactions(ts);
+CREATE INDEX IF NOT EXISTS idx_interactions_user_question ON interactions(user_id, question_id);
 """
 
+
+def init_schema(con):
+    """Tablas base + las que mantiene el escritor de respuestas (esquema de cada módulo)."""
+    con.executescript(schema)
+    item_stats.ensure_schema(con)
+    mastery.ensure_schema(con)
+    con.commit()
+
+
 if __name__ == "__main__":
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.executescript(schema)
-    con.commit()
+    init_schema(con)
     con.close()
     print("DB inicializada en", DB_PATH)
@@ -0,0 +1,235 @@
+# db_pool.py
+# -*- coding: utf-8 -*-
+"""
+Pool de conexiones SQLite para app.get_db().
+
+Las conexiones se abren una vez por proceso (con los PRAGMA de rendimiento
+aplicados al abrir) y se reutilizan entre requests. El código existente
+sigue llamando con.close(): en una PooledConnection eso devuelve la
+conexión al pool (deshaciendo lo no confirmado) en vez de cerrarla, y el
+caché de sentencias preparadas de sqlite3 se conserva entre usos.
+
+Si el pool está lleno, connect() espera a lo sumo PPIA_DB_POOL_TIMEOUT
+segundos y luego lanza PoolTimeout (la app responde 503 + Retry-After).
+Las lecturas largas (exportaciones en streaming) usan reader(): una
+conexión dedicada fuera del pool, con su propio cupo (PPIA_DB_READERS),
+para no retener una conexión del pool durante toda la descarga.
+
+Si el pool tiene `observer` (callable(segundos)), cada execute/executemany
+de sus conexiones se cronometra y se le informa (lo usa metrics.py).
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# PRAGMA aplicados a cada conexión nueva (se pueden ajustar por entorno)
+PRAGMAS = {
+    "journal_mode": os.environ.get("PPIA_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("PPIA_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("PPIA_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.environ.get("PPIA_SQLITE_CACHE_KB", "8000")) * -1,  # negativo = KiB
+    "mmap_size": int(os.environ.get("PPIA_SQLITE_MMAP_BYTES", str(64 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+POOL_SIZE = int(os.environ.get("PPIA_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("PPIA_DB_POOL_TIMEOUT", "5"))
+READERS = int(os.environ.get("PPIA_DB_READERS", "4"))
+CACHED_STATEMENTS = 256
+
+
+class PoolTimeout(Exception):
+    """No hubo conexión libre a tiempo: reintentar en retry_after segundos."""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Servidor ocupado, intenta de nuevo en unos segundos")
+        self.retry_after = retry_after
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection cuyo close() la devuelve al pool."""
+
+    pool = None
+    idle = False
+
+    def close(self):
+        pool = self.pool
+        if pool is None:
+            return super().close()
+        if self.idle:
+            return  # ya estaba devuelta (close() doble)
+        if self.in_transaction:
+            self.rollback()
+        pool.release(self)
+
+    def close_for_real(self):
+        super().close()
+
+    def execute(self, sql, parameters=(), /):
+        observer = self.pool.observer if self.pool is not None else None
+        if observer is None:
+            return super().execute(sql, parameters)
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            observer(time.perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        observer = self.pool.observer if self.pool is not None else None
+        if observer is None:
+            return super().executemany(sql, seq_of_parameters)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            observer(time.perf_counter() - t0)
+
+
+class ReaderConnection(PooledConnection):
+    """Conexión dedicada de reader(): close() la cierra de verdad y libera el cupo."""
+
+    slots = None
+
+    def close(self):
+        slots, self.slots = self.slots, None
+        self.close_for_real()
+        if slots is not None:
+            slots.release()
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = POOL_SIZE, pragmas=None,
+                 timeout: float = POOL_TIMEOUT, readers: int = READERS):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.readers = readers
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self.observer = None
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._reader_slots = threading.BoundedSemaphore(self.readers)
+        self.opens = 0
+        self.reuses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.readers_opened = 0
+
+    def _check_fork(self):
+        # Una conexión SQLite no debe cruzar un fork: el hijo empieza con un pool vacío
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    abandoned = self._idle
+                    self._reset_state()
+                    # No se cierran (serían del padre); sólo se dejan de usar
+                    _ABANDONED.append(abandoned)
+
+    def _open_connection(self, factory=PooledConnection) -> PooledConnection:
+        con = sqlite3.connect(
+            self.path,
+            timeout=self.pragmas.get("busy_timeout", 5000) / 1000,
+            factory=factory,
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False,
+        )
+        con.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            con.execute(f"PRAGMA {name}={value}")
+        con.pool = self
+        return con
+
+    def connect(self) -> PooledConnection:
+        """Conexión lista para usar; devolverla con con.close()."""
+        self._check_fork()
+        try:
+            con = self._idle.get_nowait()
+            con.idle = False
+            self.reuses += 1
+            return con
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._open < self.size
+            if can_open:
+                self._open += 1
+        if can_open:
+            try:
+                con = self._open_connection()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+            self.opens += 1
+            return con
+        # Pool lleno: esperamos (acotado) a que alguien devuelva una
+        self.waits += 1
+        try:
+            con = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            self.timeouts += 1
+            raise PoolTimeout() from None
+        con.idle = False
+        self.reuses += 1
+        return con
+
+    def reader(self) -> ReaderConnection:
+        """Conexión dedicada (fuera del pool) para lecturas largas; cerrarla con con.close()."""
+        self._check_fork()
+        slots = self._reader_slots
+        if not slots.acquire(timeout=self.timeout):
+            self.timeouts += 1
+            raise PoolTimeout()
+        try:
+            con = self._open_connection(ReaderConnection)
+        except Exception:
+            slots.release()
+            raise
+        con.slots = slots
+        self.readers_opened += 1
+        return con
+
+    def release(self, con: PooledConnection):
+        if self._pid != os.getpid():
+            return
+        con.idle = True
+        self._idle.put(con)
+
+    def close_all(self):
+        """Cierra las conexiones ociosas de este proceso (al apagar)."""
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            con.close_for_real()
+            with self._lock:
+                self._open -= 1
+                self.discarded += 1
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "size": self.size,
+            "open": self._open,
+            "idle": self._idle.qsize(),
+            "in_use": self._open - self._idle.qsize(),
+            "opens": self.opens,
+            "reuses": self.reuses,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "readers_opened": self.readers_opened,
+            "pragmas": dict(self.pragmas),
+        }
+
+
+# Conexiones heredadas de un proceso padre (se conservan para no cerrarlas en el hijo)
+_ABANDONED = []
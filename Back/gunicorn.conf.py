@@ -0,0 +1,34 @@
+# gunicorn.conf.py
+# -*- coding: utf-8 -*-
+"""
+Configuración de gunicorn (ver wsgi.py). Variables de entorno:
+  PORT            puerto (Render lo define; 10000 por defecto)
+  PPIA_WORKERS    procesos worker (o WEB_CONCURRENCY; 2 por defecto)
+  PPIA_THREADS    hilos por worker (4 por defecto)
+  PPIA_TIMEOUT    segundos antes de reiniciar un worker colgado (60)
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get("PPIA_WORKERS", os.environ.get("WEB_CONCURRENCY", "2")))
+threads = int(os.environ.get("PPIA_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.environ.get("PPIA_TIMEOUT", "60"))
+
+# La app (y el banco) se cargan una vez en el master y se comparten por copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    # Lo cargado hasta aquí no lo recorre más el GC: así sus páginas no se
+    # copian en cada worker cuando el GC toca los contadores de los objetos
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Los pools de SQLite detectan el fork solos (pid distinto) y abren
+    # conexiones nuevas; los hilos de fondo hay que arrancarlos en el worker
+    import app
+    app.start_background()
@@ -0,0 +1,206 @@
+# item_stats.py
+# -*- coding: utf-8 -*-
+"""
+Estadísticas por pregunta (tabla question_stats), mantenidas al escribir.
+
+El escritor de respuestas (answer_writer) llama a update_stats(con, rows)
+con cada lote, dentro de la misma transacción que los INSERT, así que la
+tabla nunca queda desfasada de interactions. Por pregunta se guarda:
+  attempts / successes               todos los intentos
+  first_attempts / first_successes   sólo el primer intento de cada usuario
+  recent                             últimos WINDOW resultados ('0'/'1'), ventana móvil
+
+Para llenar la tabla con lo que ya hay en interactions:
+    python item_stats.py backfill [--db quiz.db]
+"""
+import argparse
+import os
+import sqlite3
+from datetime import datetime
+
+WINDOW = int(os.environ.get("PPIA_STATS_WINDOW", "50"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id INTEGER PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    first_attempts INTEGER NOT NULL DEFAULT 0,
+    first_successes INTEGER NOT NULL DEFAULT 0,
+    recent TEXT NOT NULL DEFAULT '',
+    updated_at TEXT NOT NULL
+)
+"""
+
+def ensure_schema(con):
+    """Crea question_stats si no existe (lo usan app.ensure_schema y db_init)."""
+    con.execute(SCHEMA)
+
+
+_UPSERT_SQL = """
+    INSERT INTO question_stats
+        (question_id, attempts, successes, first_attempts, first_successes, recent, updated_at)
+    VALUES (?, ?, ?, ?, ?, substr(?, -{w}), ?)
+    ON CONFLICT(question_id) DO UPDATE SET
+        attempts = attempts + excluded.attempts,
+        successes = successes + excluded.successes,
+        first_attempts = first_attempts + excluded.first_attempts,
+        first_successes = first_successes + excluded.first_successes,
+        recent = substr(recent || excluded.recent, -{w}),
+        updated_at = excluded.updated_at
+"""
+
+
+# Parámetros por consulta en first_attempts (lejos del límite de SQLite)
+_PARAMS_PER_QUERY = 800
+
+
+def first_attempts(con, rows) -> set:
+    """
+    Pares (user_id, question_id) del lote sin intentos anteriores a él (las
+    filas ya están insertadas en la transacción). Una consulta por cada
+    ~_PARAMS_PER_QUERY parámetros: (user_id = ? AND question_id IN (...)) OR ...,
+    que SQLite resuelve con una búsqueda por par en el índice
+    (user_id, question_id); `(a, b) IN (VALUES ...)` recorrería el índice entero.
+
+    Si rows tiene `memo` (el lote de AnswerWriter) el resultado se guarda
+    ahí y los demás hooks del mismo lote no vuelven a consultar.
+    """
+    memo = getattr(rows, "memo", None)
+    if memo is not None and "first_attempts" in memo:
+        return memo["first_attempts"]
+
+    batch_counts = {}
+    for user_id, qid, _, _ in rows:
+        batch_counts[(user_id, qid)] = batch_counts.get((user_id, qid), 0) + 1
+    by_user = {}
+    for user_id, qid in batch_counts:
+        by_user.setdefault(user_id, []).append(qid)
+
+    first = set()
+    clauses, params = [], []
+    for n, (user_id, qids) in enumerate(by_user.items(), 1):
+        clauses.append(f"(user_id = ? AND question_id IN ({','.join('?' * len(qids))}))")
+        params += [user_id, *qids]
+        if len(params) < _PARAMS_PER_QUERY and n < len(by_user):
+            continue
+        cur = con.execute(f"""
+            SELECT user_id, question_id, COUNT(*) FROM interactions
+            WHERE {" OR ".join(clauses)}
+            GROUP BY user_id, question_id
+        """, params)
+        for user_id, qid, total in cur:
+            if total == batch_counts[(user_id, qid)]:
+                first.add((user_id, qid))
+        clauses, params = [], []
+
+    if memo is not None:
+        memo["first_attempts"] = first
+    return first
+
+
+def update_stats(con, rows):
+    """
+    Hook del escritor: rows = [(user_id, question_id, success, ts), ...] ya
+    insertadas en interactions (misma transacción).
+    """
+    # (usuario, pregunta) -> resultados del lote en orden
+    groups = {}
+    for user_id, qid, success, _ in rows:
+        groups.setdefault((user_id, qid), []).append(int(success))
+
+    new_pairs = first_attempts(con, rows)
+    per_q = {}
+    for (user_id, qid), results in groups.items():
+        first = (user_id, qid) in new_pairs  # no había intentos anteriores a este lote
+        acc = per_q.setdefault(qid, [0, 0, 0, 0])
+        acc[0] += len(results)
+        acc[1] += sum(results)
+        if first:
+            acc[2] += 1
+            acc[3] += results[0]
+
+    # La ventana respeta el orden de llegada dentro del lote
+    recent = {}
+    for _, qid, success, _ in rows:
+        recent[qid] = recent.get(qid, "") + ("1" if success else "0")
+
+    now = datetime.utcnow().isoformat()
+    con.executemany(_UPSERT_SQL.format(w=WINDOW), [
+        (qid, a, s, fa, fs, recent[qid], now) for qid, (a, s, fa, fs) in per_q.items()
+    ])
+
+
+def read_stats(con, question_id=None):
+    """Filas de question_stats como dicts con las tasas ya calculadas."""
+    sql = "SELECT * FROM question_stats"
+    params = ()
+    if question_id is not None:
+        sql += " WHERE question_id = ?"
+        params = (question_id,)
+    return [_with_rates(r) for r in con.execute(sql + " ORDER BY question_id", params)]
+
+
+def _with_rates(r) -> dict:
+    recent = r["recent"] or ""
+    return {
+        "question_id": r["question_id"],
+        "attempts": r["attempts"],
+        "successes": r["successes"],
+        "success_rate": round(r["successes"] / r["attempts"], 4) if r["attempts"] else None,
+        "first_attempts": r["first_attempts"],
+        "first_try_rate": round(r["first_successes"] / r["first_attempts"], 4) if r["first_attempts"] else None,
+        "window": len(recent),
+        "window_rate": round(recent.count("1") / len(recent), 4) if recent else None,
+        "updated_at": r["updated_at"],
+    }
+
+
+def backfill(con):
+    """
+    Recalcula question_stats completa desde interactions. Toma el lock de
+    escritura desde el principio para que ningún lote se cuele a mitad.
+    """
+    ensure_schema(con)
+    con.execute("BEGIN IMMEDIATE")
+    stats = {}
+    seen = set()
+    cur = con.execute("SELECT user_id, question_id, success FROM interactions ORDER BY id")
+    while True:
+        batch = cur.fetchmany(5000)
+        if not batch:
+            break
+        for user_id, qid, success in batch:
+            acc = stats.setdefault(qid, [0, 0, 0, 0, ""])
+            acc[0] += 1
+            acc[1] += success
+            if (user_id, qid) not in seen:
+                seen.add((user_id, qid))
+                acc[2] += 1
+                acc[3] += success
+            acc[4] = (acc[4] + ("1" if success else "0"))[-WINDOW:]
+
+    now = datetime.utcnow().isoformat()
+    with con:
+        con.execute("DELETE FROM question_stats")
+        con.executemany("""
+            INSERT INTO question_stats
+                (question_id, attempts, successes, first_attempts, first_successes, recent, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(qid, *acc, now) for qid, acc in sorted(stats.items())])
+    return len(stats)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Estadísticas por pregunta")
+    ap.add_argument("command", choices=("backfill", "show"))
+    ap.add_argument("--db", default=os.environ.get("PPIA_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz.db")))
+    args = ap.parse_args()
+    con = sqlite3.connect(args.db)
+    con.row_factory = sqlite3.Row
+    if args.command == "backfill":
+        print("question_stats recalculada:", backfill(con), "preguntas")
+    else:
+        for s in read_stats(con):
+            print(s)
+    con.close()
@@ -0,0 +1,352 @@
+# loadtest.py
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga local: simula una clase completa contra app.py.
+
+Cada estudiante es un hilo con su propio cliente de prueba de Flask (su
+propia cookie de sesión) y recorre el flujo real del front:
+    register -> login -> set_week -> themes_difs -> start_quiz
+    -> (q -> answer -> next_question) x rondas
+Con --flow combined usa /api/answer_next en lugar de answer + next_question.
+Todos arrancan juntos (o repartidos en --ramp segundos), como al inicio de
+una clase.
+
+Reporta throughput y latencias p50/p95/p99 por endpoint, y la contención de
+SQLite: errores "database is locked", esperas del pool de conexiones,
+estadísticas del escritor de respuestas y una sonda que intenta tomar el
+lock de escritura (BEGIN IMMEDIATE sin espera) de quiz.db y sessions.db
+cada --probe-ms y cuenta cuántas veces lo encuentra ocupado.
+
+La base, las sesiones y el log de auditoría van a un directorio temporal
+(PPIA_DB_PATH, PPIA_SESSION_DB, PPIA_AUDIT_DIR) salvo que ya estén
+definidos en el entorno. Los resultados se guardan en JSON para comparar
+corridas entre commits:
+
+    python loadtest.py --students 60 --rounds 20
+    python loadtest.py --flow combined --compare loadtest-results/<anterior>.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, "loadtest-results")
+BASE_URL = "https://localhost"  # la cookie de sesión es Secure
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Percentil por rango más cercano (valores ya ordenados)."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+class Recorder:
+    """Latencias y códigos de estado por endpoint (compartido entre hilos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def add(self, endpoint: str, seconds: float, status: int):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def summary(self, wall_s: float) -> dict:
+        out = {}
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            out[endpoint] = {
+                "count": len(values),
+                "errors": sum(n for code, n in statuses.items() if code >= 500),
+                "status": {str(code): n for code, n in sorted(statuses.items())},
+                "rps": round(len(values) / wall_s, 2) if wall_s else 0,
+                "mean_ms": round(1000 * sum(values) / len(values), 3),
+                "p50_ms": round(1000 * percentile(values, 50), 3),
+                "p95_ms": round(1000 * percentile(values, 95), 3),
+                "p99_ms": round(1000 * percentile(values, 99), 3),
+                "max_ms": round(1000 * values[-1], 3),
+            }
+        return out
+
+
+class LockProbe(threading.Thread):
+    """Cuenta qué fracción del tiempo el lock de escritura de una base está tomado."""
+
+    def __init__(self, path: str, interval: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.samples = 0
+        self.busy = 0
+        self._done = threading.Event()
+
+    def run(self):
+        con = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        try:
+            while not self._done.wait(self.interval):
+                self.samples += 1
+                try:
+                    con.execute("BEGIN IMMEDIATE")
+                    con.execute("ROLLBACK")
+                except sqlite3.OperationalError:
+                    self.busy += 1
+        finally:
+            con.close()
+
+    def stop(self) -> dict:
+        self._done.set()
+        self.join()
+        return {
+            "samples": self.samples,
+            "busy": self.busy,
+            "busy_ratio": round(self.busy / self.samples, 4) if self.samples else 0,
+        }
+
+
+class Student(threading.Thread):
+    def __init__(self, n: int, app, rec: Recorder, args, start_at: float):
+        super().__init__(daemon=True)
+        self.n = n
+        self.client = app.test_client()
+        self.rec = rec
+        self.args = args
+        self.start_at = start_at
+        self.rng = random.Random(args.seed * 100003 + n)
+        self.answered = 0
+        self.retries = 0
+        self.failed = None
+
+    def call(self, method: str, endpoint: str, url: str, body=None):
+        for attempt in range(self.args.max_retries + 1):
+            t0 = time.perf_counter()
+            if method == "GET":
+                r = self.client.get(BASE_URL + url)
+            else:
+                r = self.client.post(BASE_URL + url, json=body or {})
+            self.rec.add(endpoint, time.perf_counter() - t0, r.status_code)
+            # 503 + Retry-After (p. ej. hash de contraseñas saturado): reintenta como el front
+            if r.status_code != 503 or "Retry-After" not in r.headers or attempt == self.args.max_retries:
+                break
+            self.retries += 1
+            time.sleep(float(r.headers["Retry-After"]) * self.rng.uniform(0.5, 1.0))
+        if self.args.think_ms:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000)
+        return r
+
+    def expect(self, r, endpoint: str):
+        if r.status_code >= 400:
+            raise RuntimeError(f"{endpoint}: HTTP {r.status_code}")
+        return r.get_json(silent=True) or {}
+
+    def fetch(self, ref: dict):
+        if not self.args.skip_content:
+            self.call("GET", "q", f"/api/q/{ref['version']}/{ref['question_id']}")
+
+    def run(self):
+        time.sleep(max(0.0, self.start_at - time.perf_counter()))
+        try:
+            self.session()
+        except Exception as e:
+            self.failed = str(e)
+
+    def session(self):
+        email = f"carga{self.n}-{self.args.seed}@uniandes.edu.co"
+        self.expect(self.call("POST", "register", "/api/register", {
+            "full_name": f"Estudiante {self.n}", "email": email, "uniandes_code": str(200000000 + self.n),
+            "magistral": "1", "complementarios": "1", "password": "clave-de-prueba",
+        }), "register")
+        self.expect(self.call("POST", "login", "/api/login",
+                              {"email": email, "password": "clave-de-prueba"}), "login")
+        self.expect(self.call("POST", "set_week", "/api/set_week", {"week": self.args.week}), "set_week")
+        catalog = self.expect(self.call("GET", "themes_difs", "/api/themes_difs"), "themes_difs")
+        temas = catalog.get("temas") or []
+        difs = catalog.get("difs") or [1]
+        theme = ", ".join(self.rng.sample(temas, min(len(temas), self.rng.randint(1, 2))))
+        ref = self.expect(self.call("POST", "start_quiz", "/api/start_quiz",
+                                    {"theme": theme, "difficulty": max(difs)}), "start_quiz")
+
+        for _ in range(self.args.rounds):
+            self.fetch(ref)
+            answer = self.rng.choice("abcd")
+            if self.args.flow == "combined":
+                data = self.expect(self.call("POST", "answer_next", "/api/answer_next",
+                                             {"answer": answer, "question_id": ref["question_id"]}),
+                                   "answer_next")
+                ref = data.get("next") or {"end": True}
+            else:
+                self.expect(self.call("POST", "answer", "/api/answer", {"answer": answer}), "answer")
+                ref = self.expect(self.call("POST", "next_question", "/api/next_question",
+                                            {"continue": True}), "next_question")
+            self.answered += 1
+            if ref.get("end"):
+                break
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def run(args) -> dict:
+    import app as quiz_app  # después de fijar las rutas en el entorno
+    from sqlite3 import OperationalError
+    from flask import got_request_exception
+
+    app = quiz_app.create_app(background=False)
+    lock_errors = Counter()
+
+    def on_exception(sender, exception, **extra):
+        if isinstance(exception, OperationalError):
+            lock_errors[str(exception)] += 1
+
+    got_request_exception.connect(on_exception, app)
+
+    probes = {"quiz.db": LockProbe(quiz_app.DB_PATH, args.probe_ms / 1000)}
+    session_pool = getattr(app.session_interface, "pool", None)
+    if session_pool is not None:
+        probes["sessions.db"] = LockProbe(session_pool.path, args.probe_ms / 1000)
+    pool_before = quiz_app.DB_POOL.stats()
+
+    rec = Recorder()
+    t0 = time.perf_counter()
+    students = [Student(n, app, rec, args, t0 + (args.ramp * n / max(args.students, 1)))
+                for n in range(args.students)]
+    for p in probes.values():
+        p.start()
+    for s in students:
+        s.start()
+    for s in students:
+        s.join()
+    quiz_app.ANSWER_WRITER.flush()  # las respuestas en cola también cuentan en el tiempo total
+    wall_s = time.perf_counter() - t0
+    contention = {name: p.stop() for name, p in probes.items()}
+
+    pool_after = quiz_app.DB_POOL.stats()
+    total = sum(len(v) for v in rec.latencies.values())
+    failures = Counter(s.failed for s in students if s.failed)
+    contention.update({
+        "locked_errors": dict(lock_errors),
+        "pool_waits": pool_after["waits"] - pool_before["waits"],
+        "pool_opens": pool_after["opens"] - pool_before["opens"],
+    })
+    return {
+        "meta": {
+            "when": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "label": args.label,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+            "env": {k: v for k, v in sorted(os.environ.items())
+                    if k.startswith("PPIA_") and k not in ("PPIA_ADMIN_TOKEN",)},
+        },
+        "wall_s": round(wall_s, 3),
+        "requests": total,
+        "throughput_rps": round(total / wall_s, 2) if wall_s else 0,
+        "answers": sum(s.answered for s in students),
+        "retries": sum(s.retries for s in students),
+        "students_failed": dict(failures),
+        "endpoints": rec.summary(wall_s),
+        "contention": contention,
+        "writer": quiz_app.ANSWER_WRITER.stats(),
+        "hasher": quiz_app.PASSWORD_HASHER.stats(),
+    }
+
+
+def print_report(result: dict, baseline=None):
+    print(f"{result['requests']} requests en {result['wall_s']} s "
+          f"-> {result['throughput_rps']} req/s, {result['answers']} respuestas, "
+          f"{result['retries']} reintentos tras 503")
+    if result["students_failed"]:
+        print("Estudiantes con error:", result["students_failed"])
+    print(f"{'endpoint':>14} {'n':>6} {'5xx':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, e in result["endpoints"].items():
+        line = (f"{name:>14} {e['count']:>6} {e['errors']:>5} {e['rps']:>8} "
+                f"{e['p50_ms']:>9.2f} {e['p95_ms']:>9.2f} {e['p99_ms']:>9.2f} {e['max_ms']:>9.2f}")
+        old = (baseline or {}).get("endpoints", {}).get(name)
+        if old:
+            line += "   Δp50 {:+.1f}%  Δp99 {:+.1f}%".format(
+                _delta(old["p50_ms"], e["p50_ms"]), _delta(old["p99_ms"], e["p99_ms"]))
+        print(line)
+    c = result["contention"]
+    for name in ("quiz.db", "sessions.db"):
+        if name in c:
+            print(f"lock de escritura {name}: ocupado en {c[name]['busy']}/{c[name]['samples']} "
+                  f"muestras ({100 * c[name]['busy_ratio']:.1f}%)")
+    print("errores 'database is locked':", sum(c["locked_errors"].values()),
+          "| esperas del pool:", c["pool_waits"])
+    w = result["writer"]
+    print(f"escritor: {w['written']} filas en {w['batches']} lotes (máx {w['max_batch']}), "
+          f"commit {w['commit_s']} s, esperas por cola llena {w['backpressure_waits']}")
+    if baseline:
+        print("comparado con {} ({}): throughput {:+.1f}%".format(
+            baseline["meta"].get("git") or "?", baseline["meta"].get("when"),
+            _delta(baseline["throughput_rps"], result["throughput_rps"])))
+
+
+def _delta(old: float, new: float) -> float:
+    return 100 * (new - old) / old if old else 0.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--students", type=int, default=40)
+    ap.add_argument("--rounds", type=int, default=15, help="preguntas por estudiante")
+    ap.add_argument("--week", type=int, default=8)
+    ap.add_argument("--flow", choices=("classic", "combined"), default="classic")
+    ap.add_argument("--ramp", type=float, default=0.0, help="segundos para repartir las llegadas")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="pausa media entre requests de un estudiante")
+    ap.add_argument("--skip-content", action="store_true", help="no pedir /api/q (sólo la API del quiz)")
+    ap.add_argument("--max-retries", type=int, default=5, help="reintentos tras 503 con Retry-After")
+    ap.add_argument("--probe-ms", type=float, default=5.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--label", default="")
+    ap.add_argument("--out", help=f"archivo JSON de resultados (por defecto en {RESULTS_DIR})")
+    ap.add_argument("--compare", help="JSON de una corrida anterior para mostrar diferencias")
+    args = ap.parse_args(argv)
+
+    # Nada de la prueba toca quiz.db / sessions.db / audit reales
+    tmp = tempfile.TemporaryDirectory(prefix="ppia-carga-")
+    os.environ.setdefault("PPIA_DB_PATH", os.path.join(tmp.name, "quiz.db"))
+    os.environ.setdefault("PPIA_SESSION_DB", os.path.join(tmp.name, "sessions.db"))
+    os.environ.setdefault("PPIA_AUDIT_DIR", os.path.join(tmp.name, "audit"))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    result = run(args)
+    print_report(result, baseline)
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{result['meta']['git'] or 'local'}-{args.flow}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print("Resultados en", out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
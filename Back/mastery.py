@@ -0,0 +1,178 @@
+# mastery.py
+# -*- coding: utf-8 -*-
+"""
+Resumen por usuario y por tema canónico para el dashboard.
+
+Tablas (se mantienen al escribir, en el mismo lote que interactions):
+  user_theme_stats  (user_id, tema) -> attempts, successes, streak, last_seen
+  user_stats        user_id         -> lo mismo en total + unique_questions
+`streak` es la racha actual de aciertos consecutivos (0 tras un fallo).
+Una pregunta con varios temas ('Conjuntos,Lógica') suma en cada uno.
+
+Para llenar las tablas con lo que ya hay en interactions:
+    python mastery.py backfill [--db quiz.db]
+"""
+import argparse
+import os
+import sqlite3
+
+import item_stats
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS user_theme_stats (
+        user_id INTEGER NOT NULL,
+        tema TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        successes INTEGER NOT NULL DEFAULT 0,
+        streak INTEGER NOT NULL DEFAULT 0,
+        last_seen TEXT NOT NULL,
+        PRIMARY KEY (user_id, tema)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        successes INTEGER NOT NULL DEFAULT 0,
+        streak INTEGER NOT NULL DEFAULT 0,
+        unique_questions INTEGER NOT NULL DEFAULT 0,
+        last_seen TEXT NOT NULL
+    )
+    """,
+)
+
+
+def ensure_schema(con):
+    """Crea user_stats y user_theme_stats si no existen (lo usan app.ensure_schema y db_init)."""
+    for stmt in SCHEMA:
+        con.execute(stmt)
+
+
+class _Acc:
+    """Acumulador de un usuario o de un (usuario, tema)."""
+    __slots__ = ("attempts", "successes", "streak", "last_seen", "unique")
+
+    def __init__(self, attempts=0, successes=0, streak=0, last_seen="", unique=0):
+        self.attempts = attempts
+        self.successes = successes
+        self.streak = streak
+        self.last_seen = last_seen
+        self.unique = unique
+
+    def add(self, success: int, ts: str):
+        self.attempts += 1
+        self.successes += success
+        self.streak = self.streak + 1 if success else 0
+        self.last_seen = max(self.last_seen, ts)
+
+
+def make_hook(temas_of):
+    """
+    Hook para AnswerWriter.add_batch_hook. temas_of(qid) -> temas canónicos
+    de la pregunta (del banco activo).
+    """
+    def update_mastery(con, rows):
+        users = {r[0] for r in rows}
+        keys = {(r[0], t) for r in rows for t in temas_of(r[1])}
+        per_user = _load(con, "user_stats", users)
+        per_theme = _load(con, "user_theme_stats", keys)
+
+        # Preguntas nuevas para el usuario (sin intentos antes de este lote);
+        # la consulta se comparte con item_stats.update_stats
+        for user_id, _ in item_stats.first_attempts(con, rows):
+            per_user[user_id].unique += 1
+
+        for user_id, qid, success, ts in rows:
+            per_user[user_id].add(int(success), ts)
+            for t in temas_of(qid):
+                per_theme[(user_id, t)].add(int(success), ts)
+        _store(con, per_user, per_theme)
+
+    return update_mastery
+
+
+def _load(con, table, keys) -> dict:
+    out = {}
+    for key in keys:
+        if table == "user_stats":
+            r = con.execute("SELECT attempts, successes, streak, last_seen, unique_questions "
+                            "FROM user_stats WHERE user_id = ?", (key,)).fetchone()
+        else:
+            r = con.execute("SELECT attempts, successes, streak, last_seen "
+                            "FROM user_theme_stats WHERE user_id = ? AND tema = ?", key).fetchone()
+        out[key] = _Acc(*r) if r else _Acc()
+    return out
+
+
+def _store(con, per_user, per_theme):
+    con.executemany("""
+        INSERT OR REPLACE INTO user_stats (user_id, attempts, successes, streak, unique_questions, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(u, a.attempts, a.successes, a.streak, a.unique, a.last_seen) for u, a in per_user.items()])
+    con.executemany("""
+        INSERT OR REPLACE INTO user_theme_stats (user_id, tema, attempts, successes, streak, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(u, t, a.attempts, a.successes, a.streak, a.last_seen) for (u, t), a in per_theme.items()])
+
+
+def summary(con, user_id: int) -> dict:
+    """Totales y desglose por tema de un usuario (lectura por llave primaria)."""
+    def rate(r):
+        return round(r["successes"] / r["attempts"], 4) if r["attempts"] else 0
+
+    u = con.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+    temas = con.execute("SELECT * FROM user_theme_stats WHERE user_id = ? ORDER BY tema", (user_id,)).fetchall()
+    return {
+        "total": {
+            "attempts": u["attempts"] if u else 0,
+            "successes": u["successes"] if u else 0,
+            "accuracy": rate(u) if u else 0,
+            "streak": u["streak"] if u else 0,
+            "unique_questions": u["unique_questions"] if u else 0,
+            "last_seen": u["last_seen"] if u else None,
+        },
+        "temas": [
+            {"tema": r["tema"], "attempts": r["attempts"], "successes": r["successes"],
+             "accuracy": rate(r), "streak": r["streak"], "last_seen": r["last_seen"]}
+            for r in temas
+        ],
+    }
+
+
+def backfill(con, temas_of):
+    """Recalcula user_stats y user_theme_stats desde interactions (bajo BEGIN IMMEDIATE)."""
+    ensure_schema(con)
+    con.execute("BEGIN IMMEDIATE")
+    per_user, per_theme, seen = {}, {}, set()
+    cur = con.execute("SELECT user_id, question_id, success, ts FROM interactions ORDER BY id")
+    while True:
+        batch = cur.fetchmany(5000)
+        if not batch:
+            break
+        for user_id, qid, success, ts in batch:
+            acc = per_user.setdefault(user_id, _Acc())
+            acc.add(success, ts)
+            if (user_id, qid) not in seen:
+                seen.add((user_id, qid))
+                acc.unique += 1
+            for t in temas_of(qid):
+                per_theme.setdefault((user_id, t), _Acc()).add(success, ts)
+    with con:
+        con.execute("DELETE FROM user_stats")
+        con.execute("DELETE FROM user_theme_stats")
+        _store(con, per_user, per_theme)
+    return len(per_user)
+
+
+if __name__ == "__main__":
+    from question_bank import load_question_bank
+
+    ap = argparse.ArgumentParser(description="Resumen por usuario y tema")
+    ap.add_argument("command", choices=("backfill",))
+    ap.add_argument("--db", default=os.environ.get("PPIA_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz.db")))
+    args = ap.parse_args()
+    index = load_question_bank("Preguntas.tex").index
+    con = sqlite3.connect(args.db)
+    print("Resumen recalculado para", backfill(con, lambda qid: index.temas_of.get(qid, ())), "usuarios")
+    con.close()
@@ -0,0 +1,298 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+"""
+Métricas del proceso en formato de texto de Prometheus (las sirve /metrics).
+
+  - Requests: histograma de latencia por endpoint y método, y conteo por
+    código de estado (middleware before/after/teardown_request).
+  - SQL: cada execute/executemany de los pools instrumentados se cronometra
+    (ConnectionPool.observer). Se suma por consulta y también por request:
+    cuántas consultas hizo y cuánto tiempo pasó en SQLite (incluida la
+    sesión, que se abre antes de resolver la ruta: por eso se anotan en g y
+    se etiquetan al terminar). Las que corren fuera de un request (escritor
+    de respuestas, exportaciones en streaming) van con endpoint="(fondo)".
+  - Colectores: funciones que se evalúan al momento del scrape (fases de la
+    carga del banco, fallbacks de Pandoc, colas y cachés; ver runtime_samples).
+  - Log de requests lentos: con PPIA_SLOW_REQUEST_MS > 0 se registra con
+    app.logger cada request que tarde más, con su tiempo de SQL.
+
+Sin dependencias (no usa prometheus_client). Las métricas son por proceso:
+con varios workers de gunicorn cada scrape lo responde uno de ellos, y
+ppia_process_info dice cuál.
+"""
+import os
+import threading
+import time
+from functools import partial
+
+from flask import g, has_request_context, request
+
+import preguntas_loader
+
+ENABLED = os.environ.get("PPIA_METRICS", "1") == "1"
+SLOW_REQUEST_MS = float(os.environ.get("PPIA_SLOW_REQUEST_MS", "0"))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+BACKGROUND = "(fondo)"
+NO_ROUTE = "(sin ruta)"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [conteo por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value: float):
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(row)) for labels, row in self._values.items())
+        for labels, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-2] + [row[-1] - sum(row[:-2])]):
+                cumulative += n
+                le = (("le", _number(float(bound))),)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(row[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {row[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        m = Counter(*args, **kwargs)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        m = Histogram(*args, **kwargs)
+        self._metrics.append(m)
+        return m
+
+    def add_collector(self, fn):
+        """fn() -> [(nombre, tipo, ayuda, [(dict de etiquetas, valor), ...]), ...]"""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            for name, kind, help_text, samples in fn():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names, values = zip(*sorted(labels.items())) if labels else ((), ())
+                    lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "ppia_request_seconds", "Latencia de los requests por endpoint", ("endpoint", "method"))
+REQUESTS = REGISTRY.counter(
+    "ppia_requests_total", "Requests atendidos por endpoint y código de estado",
+    ("endpoint", "method", "status"))
+SLOW_REQUESTS = REGISTRY.counter(
+    "ppia_slow_requests_total", "Requests más lentos que PPIA_SLOW_REQUEST_MS", ("endpoint",))
+SQL_SECONDS = REGISTRY.histogram(
+    "ppia_sql_query_seconds", "Duración de cada execute/executemany", ("db", "endpoint"), SQL_BUCKETS)
+SQL_PER_REQUEST = REGISTRY.histogram(
+    "ppia_sql_queries_per_request", "Consultas SQL por request", ("endpoint",), QUERY_COUNT_BUCKETS)
+SQL_REQUEST_SECONDS = REGISTRY.histogram(
+    "ppia_sql_seconds_per_request", "Tiempo en SQLite por request", ("endpoint",), SQL_BUCKETS)
+
+
+def _endpoint() -> str:
+    return request.endpoint or NO_ROUTE
+
+
+def _observe_sql(db: str, seconds: float):
+    if has_request_context():
+        queries = g.get("_metrics_sql")
+        if queries is None:
+            queries = g._metrics_sql = []
+        queries.append((db, seconds))
+    else:
+        SQL_SECONDS.observe((db, BACKGROUND), seconds)
+
+
+def instrument(app, pools: dict, slow_ms: float = SLOW_REQUEST_MS):
+    """Middleware de tiempos en `app` y cronómetro de SQL en los pools {"nombre": ConnectionPool}."""
+    for name, pool in pools.items():
+        pool.observer = partial(_observe_sql, name)
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _metrics_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _metrics_finish(exc):
+        t0 = g.get("_metrics_t0")
+        if t0 is None:
+            return
+        elapsed = time.perf_counter() - t0
+        endpoint = _endpoint()
+        status = g.get("_metrics_status", 500)
+        queries = g.get("_metrics_sql") or []
+        sql_s = 0.0
+        for db, seconds in queries:
+            SQL_SECONDS.observe((db, endpoint), seconds)
+            sql_s += seconds
+        REQUEST_SECONDS.observe((endpoint, request.method), elapsed)
+        REQUESTS.inc((endpoint, request.method, str(status)))
+        SQL_PER_REQUEST.observe((endpoint,), len(queries))
+        SQL_REQUEST_SECONDS.observe((endpoint,), sql_s)
+        if slow_ms > 0 and elapsed * 1000 >= slow_ms:
+            SLOW_REQUESTS.inc((endpoint,))
+            app.logger.warning("request lento: %s %s -> %s en %.1f ms (%d consultas SQL, %.1f ms)",
+                               request.method, request.path, status, elapsed * 1000,
+                               len(queries), sql_s * 1000)
+
+
+def runtime_samples(writer, hasher, seen_cache, bank, pools: dict):
+    """Estado del proceso al momento del scrape: colas, pools, cachés y carga del banco."""
+    out = [("ppia_process_info", "gauge", "Proceso que respondió este scrape",
+            [({"pid": os.getpid()}, 1)])]
+
+    w = writer.stats()
+    out += [
+        ("ppia_answer_queue_depth", "gauge", "Respuestas en cola del escritor", [({}, w["depth"])]),
+        ("ppia_answer_queue_max", "gauge", "Capacidad de la cola del escritor", [({}, w["max_queue"])]),
+        ("ppia_answers_written_total", "counter", "Respuestas guardadas en SQLite", [({}, w["written"])]),
+        ("ppia_answer_batches_total", "counter", "Lotes (transacciones) del escritor", [({}, w["batches"])]),
+        ("ppia_answer_commit_seconds_total", "counter", "Tiempo total en commits del escritor",
+         [({}, w["commit_s"])]),
+        ("ppia_answer_backpressure_waits_total", "counter", "Esperas por cola llena",
+         [({}, w["backpressure_waits"])]),
+        ("ppia_answer_write_errors_total", "counter", "Lotes con error", [({}, w["errors"])]),
+    ]
+
+    h = hasher.stats()
+    out += [
+        ("ppia_password_hash_inflight", "gauge", "Hashes de contraseña en curso o en cola",
+         [({}, h["inflight"])]),
+        ("ppia_password_hash_max_inflight", "gauge", "Límite de admisión del hasher",
+         [({}, h["max_inflight"])]),
+        ("ppia_password_hash_rejected_total", "counter", "Requests rechazados con 503 por el hasher",
+         [({}, h["rejected"])]),
+        ("ppia_password_rehashed_total", "counter", "Hashes rehechos tras cambiar el método",
+         [({}, h["rehashed"])]),
+    ]
+
+    pool_stats = {name: pool.stats() for name, pool in pools.items()}
+    out += [
+        ("ppia_db_pool_in_use", "gauge", "Conexiones prestadas",
+         [({"db": n}, s["in_use"]) for n, s in pool_stats.items()]),
+        ("ppia_db_pool_open", "gauge", "Conexiones abiertas",
+         [({"db": n}, s["open"]) for n, s in pool_stats.items()]),
+        ("ppia_db_pool_waits_total", "counter", "Veces que se esperó una conexión libre",
+         [({"db": n}, s["waits"]) for n, s in pool_stats.items()]),
+        ("ppia_db_pool_timeouts_total", "counter", "Esperas de conexión que vencieron (503)",
+         [({"db": n}, s["timeouts"]) for n, s in pool_stats.items()]),
+    ]
+
+    caches = []
+    rc = preguntas_loader.render_cache_stats()
+    if rc:
+        caches.append(("render", rc["hits"], rc["misses"], rc["entries"]))
+    if bank is not None:
+        b = bank.stats()
+        for name in ("html_lru", "payloads"):
+            s = b.get(name) or {}
+            if "hits" in s:
+                caches.append((name, s["hits"], s["misses"], s["entries"]))
+    s = seen_cache.stats()
+    # refresh = bitset en memoria (sólo se leen interacciones nuevas); load = carga completa
+    caches.append(("seen", s["refreshes"], s["loads"], s["users"]))
+    out += [
+        ("ppia_cache_hits_total", "counter", "Aciertos por caché", [({"cache": c}, h) for c, h, _, _ in caches]),
+        ("ppia_cache_misses_total", "counter", "Fallos por caché", [({"cache": c}, m) for c, _, m, _ in caches]),
+        ("ppia_cache_entries", "gauge", "Entradas por caché", [({"cache": c}, e) for c, _, _, e in caches]),
+    ]
+
+    load = preguntas_loader.LOAD_STATS
+    if load:
+        out += [
+            ("ppia_bank_load_seconds", "gauge", "Duración por fase de la última carga del banco",
+             [({"phase": p}, load[f"{p}_s"]) for p in ("parse", "render", "total")]),
+            ("ppia_bank_load_issues", "gauge", "Problemas de parseo en la última carga",
+             [({}, len(load["issues"]))]),
+        ]
+    if bank is not None:
+        out.append(("ppia_bank_questions", "gauge", "Preguntas en el banco activo",
+                    [({}, len(bank.preguntas))]))
+    r = preguntas_loader.RENDER_STATS
+    out += [
+        ("ppia_pandoc_runs_total", "counter", "Invocaciones de Pandoc", [({}, r["pandoc_runs"])]),
+        ("ppia_pandoc_batch_failures_total", "counter", "Lotes de Pandoc que hubo que separar",
+         [({}, r["batch_failures"])]),
+        ("ppia_pandoc_fallbacks_total", "counter", "Fragmentos en el fallback de latex_to_html",
+         [({}, r["fallbacks"])]),
+    ]
+    return out
@@ -0,0 +1,156 @@
+# password_hasher.py
+# -*- coding: utf-8 -*-
+"""
+Hash de contraseñas fuera de los hilos web, con control de admisión.
+
+generate/check_password_hash son caros a propósito (scrypt/PBKDF2). Aquí
+corren en un pool acotado de hilos (hashlib suelta el GIL mientras calcula),
+y como mucho MAX_INFLIGHT trabajos pueden estar en curso o en cola: si no hay
+lugar en ADMISSION_WAIT segundos se lanza HasherBusy y el endpoint responde
+503 con Retry-After, en vez de que todos los logins de la clase expiren
+juntos.
+
+El método se configura con PPIA_PASSWORD_METHOD (formato de werkzeug, p. ej.
+"scrypt:32768:8:1" o "pbkdf2:sha256:600000"). Si cambia, los hashes viejos
+siguen sirviendo y se rehacen solos en el siguiente login correcto.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+METHOD = os.environ.get("PPIA_PASSWORD_METHOD", "scrypt")
+WORKERS = int(os.environ.get("PPIA_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_INFLIGHT = int(os.environ.get("PPIA_HASH_MAX_INFLIGHT", str(WORKERS * 8)))
+ADMISSION_WAIT = float(os.environ.get("PPIA_HASH_ADMISSION_WAIT", "2.0"))
+RESULT_TIMEOUT = float(os.environ.get("PPIA_HASH_TIMEOUT", "20.0"))
+
+
+class HasherBusy(Exception):
+    """No hay lugar para más trabajo de hash: reintentar en retry_after segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Servidor ocupado, intenta de nuevo en unos segundos")
+        self.retry_after = retry_after
+
+
+def method_prefix(method: str) -> str:
+    """
+    Lo que werkzeug escribe antes del primer '$' al hashear con `method`
+    ("scrypt" -> "scrypt:32768:8:1"), sin calcular ningún hash.
+    """
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Método de hash no soportado: {method!r}")
+
+
+class PasswordHasher:
+    def __init__(self, method=METHOD, workers=WORKERS, max_inflight=MAX_INFLIGHT,
+                 admission_wait=ADMISSION_WAIT):
+        self.method = method
+        self.workers = workers
+        self.max_inflight = max_inflight
+        self.admission_wait = admission_wait
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._reset_executor()
+        self._method_prefix = method_prefix(method)
+        self._inflight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _reset_executor(self):
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="pwhash")
+
+    def _submit(self, fn, *args, admit=True):
+        if self._pid != os.getpid():
+            # Los hilos del pool no sobreviven a un fork
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_executor()
+        if admit:
+            if not self._slots.acquire(timeout=self.admission_wait):
+                self.rejected += 1
+                raise HasherBusy(self.retry_after())
+        with self._lock:
+            self._inflight += 1
+        future = self._executor.submit(fn, *args)
+
+        def done(_):
+            with self._lock:
+                self._inflight -= 1
+                self.completed += 1
+            if admit:
+                self._slots.release()
+
+        future.add_done_callback(done)
+        return future
+
+    def _run(self, fn, *args):
+        try:
+            return self._submit(fn, *args).result(RESULT_TIMEOUT)
+        except TimeoutError:
+            # Admitido pero la cola avanza demasiado lento: mismo trato que sin lugar
+            raise HasherBusy(self.retry_after())
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str, on_rehash=None) -> bool:
+        """
+        True si la contraseña corresponde al hash. Si es correcta, el hash usa
+        otro método y se pasó on_rehash, el mismo trabajo (no el request) agenda
+        el rehash y luego llama a on_rehash(nuevo_hash).
+        """
+        def job():
+            ok = check_password_hash(pwhash, password)
+            if ok and on_rehash is not None and self.needs_rehash(pwhash):
+                self.rehash_later(password, on_rehash)
+            return ok
+
+        return self._run(job)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True si el hash se generó con otro método/parámetros que los actuales (sin hashear)."""
+        return pwhash.split("$", 1)[0] != self._method_prefix
+
+    def rehash_later(self, password: str, on_done):
+        """
+        Rehace el hash en segundo plano (sin esperar ni ocupar lugar de admisión:
+        si el pool está saturado simplemente se hará en otro login) y llama a
+        on_done(nuevo_hash). Se llama desde el trabajo de verify, que todavía
+        cuenta en _inflight.
+        """
+        if self._inflight > self.workers:
+            return
+
+        def job():
+            new_hash = generate_password_hash(password, self.method)
+            on_done(new_hash)
+            self.rehashed += 1
+
+        self._submit(job, admit=False)
+
+    def retry_after(self) -> int:
+        # Estimación gruesa: ~0.1 s por hash (scrypt por defecto) repartido en los workers
+        return max(1, round(self.max_inflight * 0.1 / max(self.workers, 1)))
+
+    def stats(self) -> dict:
+        return {
+            "method": self.method,
+            "workers": self.workers,
+            "max_inflight": self.max_inflight,
+            "inflight": self._inflight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
@@ -1,9 +1,18 @@
 # preguntas_loader.py
 # -*- coding: utf-8 -*-
+import hashlib
+import multiprocessing
 import os
 import re
+import subprocess
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from html import escape
 
+from render_cache import RenderCache, fragment_key
+
 # ---------------------------
 # Carga y parseo de Preguntas.tex
 # ---------------------------
@@ -65,7 +74,18 @@ def canon_tema(raw: str) -> str:
     # Fallback: lo dejamos en formato Título a partir del original
     return s[:1].upper() + s[1:].lower()
 
-def load_preguntas_from_latex(file_name: str):
+# Procesos para la carga paralela (1 = secuencial)
+LOADER_WORKERS = int(os.environ.get("PPIA_LOADER_WORKERS", "1"))
+
+# Métricas de la última carga (tiempos por fase y, en modo paralelo, por worker)
+LOAD_STATS = {}
+
+# Contadores acumulados del proceso: invocaciones de Pandoc, lotes que no se
+# pudieron separar y fragmentos que terminaron en el fallback de latex_to_html
+RENDER_STATS = {"pandoc_runs": 0, "batch_failures": 0, "fallbacks": 0}
+
+
+def load_preguntas_from_latex(file_name: str, batch_size=None, workers=None):
     """
     Lee el archivo LaTeX y extrae preguntas definidas con el entorno question.
     Estructura de cada pregunta:
@@ -78,93 +98,384 @@ def load_preguntas_from_latex(file_name: str):
         'enunciado_html': str,
         'opts': dict[letra]=texto
     }
+    batch_size: fragmentos por invocación de Pandoc (None = PPIA_PANDOC_BATCH,
+    0 = una invocación por fragmento, como antes).
+    workers: procesos para parsear/renderizar en paralelo (None = PPIA_LOADER_WORKERS,
+    1 = secuencial). El resultado es idéntico en ambos modos.
     """
+    t0 = time.perf_counter()
+    matches = _read_question_blocks(file_name)
+
+    if workers is None:
+        workers = LOADER_WORKERS
+    workers = max(1, min(workers, len(matches) or 1))
+
+    if workers == 1:
+        entries, timing = _load_matches(matches, batch_size)
+        worker_stats = [timing]
+    else:
+        entries, worker_stats = _load_matches_parallel(matches, batch_size, workers)
+
+    preguntas = dict(entries)
+
+    save_render_cache()
+
+    LOAD_STATS.clear()
+    LOAD_STATS.update({
+        "questions": len(preguntas),
+        "workers": worker_stats,
+        "parse_s": sum(w["parse_s"] for w in worker_stats),
+        "render_s": sum(w["render_s"] for w in worker_stats),
+        "total_s": time.perf_counter() - t0,
+        "issues": list(PARSE_ISSUES),
+    })
+    return preguntas
+
+
+def _read_question_blocks(file_name: str):
+    """Lee el .tex (relativo a este directorio), activa su caché y devuelve los bloques question."""
     current_dir = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(current_dir, file_name)
+
+    use_render_cache(render_cache_path(file_path))
+
+    del PARSE_ISSUES[:]
     with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    pattern = r"\\begin\{question\}\{(\d+)\}\{([^\}]+)\}\{(\d+)\}\{([^\}]+)\}\{(\d+)\}\{([\s\S]+?)\}\s*\\end\{question\}"
-    preguntas = {}
-    matches = re.findall(pattern, content, re.DOTALL)
-
-    for qid_str, tema, dif_str, res_str, week_str, body in matches:
-        qid = int(qid_str)
-        dif = int(dif_str)
-        week = int(week_str)
-        res_list = [r.strip() for r in res_str.split(',')]
-
-        # ---- CANONIZACIÓN DE TEMAS ----
-        raw_topics = [t.strip() for t in tema.split(",") if t.strip()]
-        canon_set = set()
-        for t in raw_topics:
-            ct = canon_tema(t)
-            if ct:
-                canon_set.add(ct)
-        canon_topics = ",".join(sorted(canon_set))  # orden consistente
-
-        # -------- Opciones del enumerate (sin duplicar letras) --------
-        # Captura el bloque interno de enumerate
-        enum_match = re.search(r"\\begin\{enumerate\}([\s\S]+?)\\end\{enumerate\}", body)
-        enum_src = enum_match.group(1) if enum_match else ""
-
-        # Soporta "\item a) ..." y toma el texto hasta el siguiente \item
-        items = re.findall(r"\\item\s*([A-Za-z])\)\s*([\s\S]*?)(?=(\\item|$))", enum_src)
-
-        # Guardamos también el texto “original” de cada opción por si lo necesitas
-        opts = {}
-
-        # --- utilitaria: arregla $...$ y $$...$$ para que MathJax/Pandoc no sufran
-        def _fix_inline_dollars(tex: str) -> str:
-            tex = tex.strip()
-            # Normaliza $$...$$ a \[...\] (bloque)
-            tex = re.sub(r"\$\$([\s\S]*?)\$\$", r"\\[\1\\]", tex)
-
-            # Si queda un número impar de '$', recorta un $ colgante al final (defensa)
-            if tex.count("$") % 2 == 1:
-                tex = tex.rstrip("$")
-
-            # Reemplaza $...$ (inline) por \( ... \)
-            tex = re.sub(r"\$([^$]+)\$", r"\\(\1\\)", tex)
-            return tex
-
-        # --- Enunciado sin el enumerate (como ya lo tenías)
-        body_no_enum = re.sub(r"\\begin\{enumerate\}([\s\S]+?)\\end\{enumerate\}", "", body, flags=re.DOTALL).strip()
-        body_no_enum = sanitize_latex_fragment(body_no_enum)
-        html = latex_to_html(body_no_enum)
-
-        # --- Construye el <ol> de opciones renderizando cada li con Pandoc
-        if items:
-            html += "<ol type='a' class='options-list' style='padding-left:1.5rem; margin-top:.5rem;'>\n"
-            for letra, texto, _ in items:
-                # elimina "a)" inicial si vino duplicado en el banco
-                txt = re.sub(r'^[A-Za-z]\)\s*', '', texto).strip()
-                opts[letra.lower()] = " ".join(txt.split())
-
-                # prepara el LaTeX del li
-                txt = _fix_inline_dollars(txt)
-                txt = sanitize_latex_fragment(txt)
-
-                # convierte con Pandoc para que quede igual de “bonito” que el enunciado
-                li_html = latex_to_html(txt).strip()
-
-                # Si Pandoc envolvió en <p>...</p>, lo quitamos para no anidar párrafos en <li>
-                li_html = re.sub(r'^<p>([\s\S]*?)</p>\s*$', r'\1', li_html)
-
-                html += f"<li>{li_html}</li>\n"
-            html += "</ol>\n"
+        return [groups for _, groups in iter_question_blocks(f, PARSE_ISSUES)]
+
+
+# ---------------------------
+# Tokenizador de bloques \begin{question}...\end{question}
+# ---------------------------
+_BEGIN_Q = "\\begin{question}"
+_END_Q = "\\end{question}"
+# {id}{tema(s)}{dif}{res(s)}{week}{  (la apertura del enunciado)
+_HEADER_RE = re.compile(r"\{(\d+)\}\{([^\}]+)\}\{(\d+)\}\{([^\}]+)\}\{(\d+)\}\{")
+# Lo único que importa para la profundidad de llaves: escapes, llaves y comentarios
+_BRACE_TOKEN_RE = re.compile(r"\\.|[{}]|%[^\n]*", re.DOTALL)
+_TRAILING_CLOSE_RE = re.compile(r"\}\s*$")
+
+# Problemas del último parseo: [(línea, mensaje)]
+PARSE_ISSUES = []
+
+
+def _body_end(text: str, start: int):
+    """
+    Posición de la llave que cierra el enunciado (profundidad 0), contando
+    desde `start` (justo después de la llave de apertura). None si no cierra.
+    """
+    depth = 1
+    for m in _BRACE_TOKEN_RE.finditer(text, start):
+        tok = m.group()
+        if tok == "{":
+            depth += 1
+        elif tok == "}":
+            depth -= 1
+            if depth == 0:
+                return m.start()
+    return None
+
+
+def _split_block(block: str, lineno: int, issues):
+    """
+    block va de \\begin{question} hasta justo antes de \\end{question}.
+    Devuelve los 6 grupos (id, tema, dif, res, week, enunciado) o None.
+    """
+    header = _HEADER_RE.match(block, len(_BEGIN_Q))
+    if not header:
+        issues.append((lineno, "encabezado inválido: se esperaba {id}{tema}{dif}{res}{week}{"))
+        return None
+    body_start = header.end()
+
+    # El enunciado termina en la llave que cierra la de apertura...
+    end = _body_end(block, body_start)
+    if end is None or block[end + 1:].strip():
+        # ...y si las llaves del enunciado están desbalanceadas, en la última '}'
+        # antes de \end{question} (lo que hacía el regex original)
+        closing = _TRAILING_CLOSE_RE.search(block, body_start)
+        if not closing:
+            issues.append((lineno, "falta la '}' que cierra el enunciado antes de \\end{question}"))
+            return None
+        issues.append((lineno, "llaves desbalanceadas en el enunciado"))
+        end = closing.start()
+
+    body = block[body_start:end]
+    if not body:
+        issues.append((lineno, "enunciado vacío"))
+        return None
+    return header.groups() + (body,)
+
+
+def iter_question_blocks(lines, issues=None):
+    """
+    Recorre el .tex línea a línea (en un solo paso) y va entregando
+    (número de línea, grupos) por cada bloque question bien formado.
+    Los bloques con problemas se anotan en `issues` como (línea, mensaje).
+    """
+    if issues is None:
+        issues = []
+    seen = {}
+    buf = None       # texto del bloque en curso (desde \begin{question})
+    start_line = 0
+    for lineno, line in enumerate(lines, 1):
+        pos = 0
+        while True:
+            if buf is None:
+                i = line.find(_BEGIN_Q, pos)
+                if i < 0:
+                    break
+                buf, start_line, pos = [_BEGIN_Q], lineno, i + len(_BEGIN_Q)
+            j = line.find(_END_Q, pos)
+            k = line.find(_BEGIN_Q, pos)
+            if k >= 0 and (j < 0 or k < j):
+                # Se abrió otra pregunta sin cerrar la actual: la descartamos
+                issues.append((start_line, "bloque sin \\end{question}"))
+                buf, pos = None, k
+                continue
+            if j < 0:
+                buf.append(line[pos:])
+                break
+            buf.append(line[pos:j])
+            groups = _split_block("".join(buf), start_line, issues)
+            if groups is not None:
+                qid = int(groups[0])
+                if qid in seen:
+                    issues.append((start_line, f"id {qid} repetido (ya definido en la línea {seen[qid]}); se usa el último"))
+                seen[qid] = start_line
+                yield start_line, groups
+            buf, pos = None, j + len(_END_Q)
+    if buf is not None:
+        issues.append((start_line, "bloque sin \\end{question} al final del archivo"))
+
+
+def parse_preguntas_from_latex(file_name: str) -> dict:
+    """
+    Como load_preguntas_from_latex pero SIN renderizar (modo lazy):
+    dict[int] -> registro con los metadatos más 'stem_tex' e 'items_tex',
+    que luego se convierten con render_question_html.
+    """
+    t0 = time.perf_counter()
+    records = {}
+    for m in _read_question_blocks(file_name):
+        rec = _parse_question(*m)
+        records[rec["id"]] = rec
+    LOAD_STATS.clear()
+    LOAD_STATS.update({
+        "questions": len(records),
+        "workers": [],
+        "parse_s": time.perf_counter() - t0,
+        "render_s": 0.0,
+        "total_s": time.perf_counter() - t0,
+        "issues": list(PARSE_ISSUES),
+    })
+    return records
+
+
+def render_question_html(rec: dict) -> str:
+    """HTML completo (enunciado + opciones) de un registro de parse_preguntas_from_latex."""
+    return render_records_html([rec])[0]
+
+
+def question_hashes(file_name: str) -> dict:
+    """qid -> hash del bloque question tal como está en el .tex (sin renderizar)."""
+    return {int(m[0]): _block_hash(m) for m in _read_question_blocks(file_name)}
+
+
+def _block_hash(groups) -> str:
+    return hashlib.sha1("\0".join(groups).encode("utf-8")).hexdigest()
+
+
+def _load_matches(matches, batch_size=None):
+    """
+    Parsea y renderiza una lista de bloques question (grupos del regex).
+    Devuelve ([(qid, pregunta), ...] en el orden del archivo, tiempos).
+    """
+    t0 = time.perf_counter()
+
+    # 1) Parseo: metadatos + fragmentos LaTeX ya sanitizados (sin Pandoc todavía)
+    records = [_parse_question(*m) for m in matches]
+    t1 = time.perf_counter()
 
+    # 2) Render de TODOS los fragmentos (en lotes, con caché) y ensamble
+    htmls = render_records_html(records, batch_size)
+
+    entries = []
+    for rec, html in zip(records, htmls):
         # --- Guarda estructura
-        preguntas[qid] = {
-            "tema": canon_topics,   # <-- YA UNIFICADO
-            "dif": dif,
-            "res": res_list,
-            "week": week,
+        entries.append((rec["id"], {
+            "tema": rec["tema"],   # <-- YA UNIFICADO
+            "dif": rec["dif"],
+            "res": rec["res"],
+            "week": rec["week"],
             "enunciado_html": html,
-            "opts": opts
-        }
+            "opts": rec["opts"]
+        }))
+    t2 = time.perf_counter()
+
+    return entries, {
+        "pid": os.getpid(),
+        "questions": len(records),
+        "fragments": sum(1 + len(rec["items_tex"]) for rec in records),
+        "parse_s": t1 - t0,
+        "render_s": t2 - t1,
+    }
 
-    return preguntas
+
+def render_records_html(records, batch_size=None):
+    """HTML de varios registros parseados, mandando todos sus fragmentos juntos a Pandoc."""
+    fragments = []
+    for rec in records:
+        fragments.append(rec["stem_tex"])
+        fragments.extend(tex for _, tex in rec["items_tex"])
+    rendered = iter(render_fragments(fragments, batch_size))
+
+    htmls = []
+    for rec in records:
+        stem_html = next(rendered)
+        items_html = [next(rendered) for _ in rec["items_tex"]]
+        htmls.append(_question_html(stem_html, items_html))
+    return htmls
+
+
+def _load_slice_worker(matches, batch_size, cache_path):
+    """
+    Entrada de cada proceso del pool: abre su copia del caché y procesa su
+    tramo. Devuelve también lo que sumó a RENDER_STATS (el worker reutiliza
+    su proceso y con fork hereda los contadores del principal).
+    """
+    cache = use_render_cache(cache_path)
+    if cache is not None:
+        cache.take_new()  # con fork se hereda lo pendiente del proceso principal
+    before = dict(RENDER_STATS)
+    entries, timing = _load_matches(matches, batch_size)
+    new_html = cache.take_new() if cache is not None else {}
+    render_delta = {k: RENDER_STATS[k] - before[k] for k in RENDER_STATS}
+    return entries, timing, new_html, render_delta
+
+
+def _load_matches_parallel(matches, batch_size, workers):
+    """
+    Reparte los bloques en tramos contiguos entre `workers` procesos y une
+    los resultados en el orden original (salida determinista). Los fragmentos
+    que cada worker convirtió se incorporan al caché del proceso principal, y
+    sus corridas de Pandoc y fallbacks a RENDER_STATS.
+    """
+    cache_path = _render_cache.path if _render_cache is not None else None
+    if _render_cache is not None:
+        # Que los workers partan de lo ya convertido
+        _render_cache.save()
+
+    step = -(-len(matches) // workers)
+    slices = [matches[i:i + step] for i in range(0, len(matches), step)]
+
+    # fork evita re-importar el módulo en cada worker cuando está disponible
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+
+    entries, worker_stats = [], []
+    with ProcessPoolExecutor(max_workers=len(slices), mp_context=ctx) as pool:
+        futures = [pool.submit(_load_slice_worker, sl, batch_size, cache_path) for sl in slices]
+        for n, fut in enumerate(futures):
+            part, timing, new_html, render_delta = fut.result()
+            entries.extend(part)
+            for key, count in render_delta.items():
+                RENDER_STATS[key] += count
+            timing["slice"] = n
+            worker_stats.append(timing)
+            if _render_cache is not None:
+                for key, html in new_html.items():
+                    _render_cache.put(key, html)
+    return entries, worker_stats
+
+
+# Patrones por pregunta, compilados una sola vez
+_ENUM_RE = re.compile(r"\\begin\{enumerate\}([\s\S]+?)\\end\{enumerate\}", re.DOTALL)
+_ITEM_RE = re.compile(r"\\item\s*([A-Za-z])\)\s*([\s\S]*?)(?=(\\item|$))")
+_ITEM_PREFIX_RE = re.compile(r'^[A-Za-z]\)\s*')
+_DISPLAY_DOLLARS_RE = re.compile(r"\$\$([\s\S]*?)\$\$")
+_INLINE_DOLLARS_RE = re.compile(r"\$([^$]+)\$")
+_LI_PARAGRAPH_RE = re.compile(r'^<p>([\s\S]*?)</p>\s*$')
+_EXTRA_CLOSES_RE = re.compile(r"\}{2,}\s*$")
+
+
+# --- utilitaria: arregla $...$ y $$...$$ para que MathJax/Pandoc no sufran
+def _fix_inline_dollars(tex: str) -> str:
+    tex = tex.strip()
+    # Normaliza $$...$$ a \[...\] (bloque)
+    tex = _DISPLAY_DOLLARS_RE.sub(r"\\[\1\\]", tex)
+
+    # Si queda un número impar de '$', recorta un $ colgante al final (defensa)
+    if tex.count("$") % 2 == 1:
+        tex = tex.rstrip("$")
+
+    # Reemplaza $...$ (inline) por \( ... \)
+    tex = _INLINE_DOLLARS_RE.sub(r"\\(\1\\)", tex)
+    return tex
+
+
+def _parse_question(qid_str, tema, dif_str, res_str, week_str, body) -> dict:
+    """
+    Convierte los grupos de un bloque question en un registro intermedio:
+    metadatos + 'stem_tex' (enunciado) e 'items_tex' [(letra, tex)] listos para Pandoc.
+    """
+    res_list = [r.strip() for r in res_str.split(',')]
+
+    # ---- CANONIZACIÓN DE TEMAS ----
+    raw_topics = [t.strip() for t in tema.split(",") if t.strip()]
+    canon_set = set()
+    for t in raw_topics:
+        ct = canon_tema(t)
+        if ct:
+            canon_set.add(ct)
+    canon_topics = ",".join(sorted(canon_set))  # orden consistente
+
+    # -------- Opciones del enumerate (sin duplicar letras) --------
+    # Captura el bloque interno de enumerate
+    enum_match = _ENUM_RE.search(body)
+    enum_src = enum_match.group(1) if enum_match else ""
+
+    # Soporta "\item a) ..." y toma el texto hasta el siguiente \item
+    items = _ITEM_RE.findall(enum_src)
+
+    # Guardamos también el texto “original” de cada opción por si lo necesitas
+    opts = {}
+    items_tex = []
+    for letra, texto, _ in items:
+        # elimina "a)" inicial si vino duplicado en el banco
+        txt = _ITEM_PREFIX_RE.sub('', texto).strip()
+        opts[letra.lower()] = " ".join(txt.split())
+
+        # prepara el LaTeX del li
+        txt = _fix_inline_dollars(txt)
+        items_tex.append((letra, sanitize_latex_fragment(txt)))
+
+    # --- Enunciado sin el enumerate (como ya lo tenías)
+    body_no_enum = _ENUM_RE.sub("", body).strip()
+
+    return {
+        "src_hash": _block_hash((qid_str, tema, dif_str, res_str, week_str, body)),
+        "id": int(qid_str),
+        "tema": canon_topics,
+        "dif": int(dif_str),
+        "res": res_list,
+        "week": int(week_str),
+        "opts": opts,
+        "stem_tex": sanitize_latex_fragment(body_no_enum),
+        "items_tex": items_tex,
+    }
+
+
+def _question_html(stem_html: str, items_html) -> str:
+    """Enunciado + <ol> de opciones (cada li ya convertido por Pandoc)."""
+    html = stem_html
+    if items_html:
+        html += "<ol type='a' class='options-list' style='padding-left:1.5rem; margin-top:.5rem;'>\n"
+        for li_html in items_html:
+            # Si Pandoc envolvió en <p>...</p>, lo quitamos para no anidar párrafos en <li>
+            li_html = _LI_PARAGRAPH_RE.sub(r'\1', li_html.strip())
+            html += f"<li>{li_html}</li>\n"
+        html += "</ol>\n"
+    return html
 
 
 def sanitize_latex_fragment(s: str) -> str:
@@ -184,53 +495,222 @@ def sanitize_latex_fragment(s: str) -> str:
         closes -= 1
 
     # A veces queda '}}' al final del fragmento; recorta extra
-    s = re.sub(r"\}{2,}\s*$", "}", s)
+    s = _EXTRA_CLOSES_RE.sub("}", s)
 
     return s
 
 
+# ---------------------------
+# Caché de renderizado (Pandoc)
+# ---------------------------
+# Cómo sale la matemática: "mathjax" (TeX que tipografía MathJax en el navegador)
+# o "mathml" (Pandoc la convierte a MathML al construir el banco; el navegador la
+# muestra sin JavaScript). Cambiarlo invalida el caché y el artefacto (van en los flags).
+MATH_RENDER = os.environ.get("PPIA_MATH_RENDER", "mathjax")
+PANDOC_FLAGS = ("-f", "latex", "-t", "html5",
+                "--mathml" if MATH_RENDER == "mathml" else "--mathjax", "--quiet")
+
+# TeX que quedó sin convertir: spans math de Pandoc (--mathjax o fórmulas que
+# texmath no pudo pasar a MathML) o delimitadores \( \[ del fallback
+_RAW_MATH_RE = re.compile(r'class="math |\\\(|\\\[')
+
+
+def needs_mathjax(html: str) -> bool:
+    """True si el HTML trae matemática en TeX que sólo MathJax puede mostrar."""
+    return _RAW_MATH_RE.search(html) is not None
+
+# Caché activo; se abre junto al banco al cargar (PPIA_RENDER_CACHE=0 lo desactiva)
+_render_cache = None
+
+
+def render_cache_path(bank_path: str) -> str:
+    """Archivo de caché que acompaña al banco: Preguntas.tex -> Preguntas.render-cache.json"""
+    return os.path.splitext(bank_path)[0] + ".render-cache.json"
+
+
+def use_render_cache(path):
+    """Activa (o desactiva con path=None) el caché persistente de fragmentos."""
+    global _render_cache
+    if path is None or os.environ.get("PPIA_RENDER_CACHE", "1") == "0":
+        _render_cache = None
+    elif _render_cache is None or _render_cache.path != path:
+        _render_cache = RenderCache(path)
+    return _render_cache
+
+
+def save_render_cache():
+    """Persiste el caché activo (no hace nada si está desactivado)."""
+    if _render_cache is not None:
+        _render_cache.save()
+
+
+def render_cache_stats() -> dict:
+    """Aciertos/fallos/evicciones del caché de renderizado (vacío si está desactivado)."""
+    return _render_cache.stats() if _render_cache is not None else {}
+
+
+@lru_cache(maxsize=None)
+def pandoc_version() -> str:
+    """Primera línea de `pandoc --version` ('' si Pandoc no está instalado)."""
+    try:
+        out = subprocess.run(["pandoc", "--version"], capture_output=True,
+                             text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return out.splitlines()[0].strip() if out else ""
+
+
+# Lotes: cuántos fragmentos se mandan a un solo proceso de Pandoc (0 = uno por fragmento)
+PANDOC_BATCH_SIZE = int(os.environ.get("PPIA_PANDOC_BATCH", "400"))
+
+# Separador entre fragmentos dentro de un lote: un párrafo con un token que
+# no aparece en el banco. Pandoc lo devuelve como <p>TOKEN<n></p>.
+_BATCH_TOKEN = "PPIAFRAGMENTO" + uuid.uuid4().hex
+_BATCH_SPLIT_RE = re.compile(r"<p>" + _BATCH_TOKEN + r"(\d+)</p>\s*")
+
+
+def _run_pandoc(src: str) -> str:
+    """Convierte un documento LaTeX con Pandoc usando pipes (sin archivos temporales)."""
+    # Fragmento (sin -s) para no traer CSS global de Pandoc
+    RENDER_STATS["pandoc_runs"] += 1
+    return subprocess.run(["pandoc", *PANDOC_FLAGS], input=src, capture_output=True,
+                          encoding="utf-8", check=True).stdout
+
+
+def _clean_pandoc_html(html_content: str) -> str:
+    # Por defensa: quitar etiquetas de documento/estilos si se cuelan
+    html_content = re.sub(r"</?(html|head|body)[^>]*>", "", html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r"<style[^>]*>[\s\S]*?</style>", "", html_content, flags=re.IGNORECASE)
+    return html_content
+
+
+def _cache_key(src: str):
+    if _render_cache is None:
+        return None
+    return fragment_key(src, pandoc_version(), PANDOC_FLAGS)
+
+
 def latex_to_html(src: str) -> str:
-    import subprocess, tempfile, os, re
-    from html import escape
+    cache_key = _cache_key(src)
+    if cache_key is not None:
+        cached = _render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    return _convert_fragment(src, cache_key)
+
 
+# Texto con el que empieza el HTML de respaldo: ese HTML no debe quedar en el
+# artefacto ni servirse como inmutable (ver bank_artifact / question_bank)
+FALLBACK_MARK = "Error al convertir con Pandoc"
+
+
+def has_fallback(html: str) -> bool:
+    """True si el HTML salió (en todo o en parte) del fallback sin Pandoc."""
+    return FALLBACK_MARK in html
+
+
+def _convert_fragment(src: str, cache_key) -> str:
+    """Una invocación de Pandoc para un fragmento (con el fallback de siempre)."""
     try:
-        with tempfile.NamedTemporaryFile(suffix=".tex", delete=False) as tf:
-            tf.write(src.encode("utf-8"))
-            tex_path = tf.name
-        html_path = tex_path.replace(".tex", ".html")
-
-        # Fragmento (sin -s) para no traer CSS global de Pandoc
-        subprocess.run([
-            "pandoc",
-            tex_path,
-            "-f", "latex",
-            "-t", "html5",
-            "--mathjax",
-            "--quiet",
-            "-o", html_path
-        ], check=True)
-
-        with open(html_path, "r", encoding="utf-8") as f:
-            html_content = f.read()
-
-        # Por defensa: quitar etiquetas de documento/estilos si se cuelan
-        html_content = re.sub(r"</?(html|head|body)[^>]*>", "", html_content, flags=re.IGNORECASE)
-        html_content = re.sub(r"<style[^>]*>[\s\S]*?</style>", "", html_content, flags=re.IGNORECASE)
-
-        os.remove(tex_path)
-        os.remove(html_path)
+        html_content = _clean_pandoc_html(_run_pandoc(src))
 
+        # Sólo se cachean conversiones exitosas: el fallback se reintenta en el próximo arranque
+        if cache_key is not None:
+            _render_cache.put(cache_key, html_content)
         return html_content
 
     except Exception as e:
         # Fallback simple si Pandoc falla: evita romper la app
+        RENDER_STATS["fallbacks"] += 1
         s = src
         s = re.sub(r"\\textbf\{([^}]*)\}", r"<b>\1</b>", s)
         s = re.sub(r"\\textit\{([^}]*)\}", r"<i>\1</i>", s)
         s = s.replace("\\\\", "<br>")
         s = escape(s)
-        return f"<p>Error al convertir con Pandoc ({str(e)}). Versión simple:<br>{s}</p>"
+        return f"<p>{FALLBACK_MARK} ({str(e)}). Versión simple:<br>{s}</p>"
+
+
+def _pandoc_batch(sources):
+    """
+    Convierte varios fragmentos con UNA invocación de Pandoc.
+    Devuelve la lista de HTML en el mismo orden, o None si el lote no se pudo
+    convertir o separar (p. ej. un fragmento se "comió" un separador).
+    """
+    doc = "".join(f"\n\n{_BATCH_TOKEN}{i}\n\n{src}" for i, src in enumerate(sources))
+    try:
+        out = _run_pandoc(doc)
+    except (OSError, subprocess.CalledProcessError):
+        return None
 
+    parts = _BATCH_SPLIT_RE.split(out)
+    # parts = [prefijo, "0", html0, "1", html1, ...]
+    if parts[0].strip() or len(parts) != 2 * len(sources) + 1:
+        return None
+    if [int(i) for i in parts[1::2]] != list(range(len(sources))):
+        return None
+    return [_clean_pandoc_html(h) for h in parts[2::2]]
 
-# Carga inmediata en import
-Preguntas = load_preguntas_from_latex("Preguntas.tex")
+
+def render_fragments(sources, batch_size=None):
+    """
+    Convierte una lista de fragmentos LaTeX a HTML (mismo orden).
+    Primero resuelve desde el caché; lo que falte se manda a Pandoc en lotes
+    de batch_size fragmentos. Si un lote falla, sus fragmentos se convierten
+    uno a uno con latex_to_html (que conserva el fallback de siempre).
+    """
+    if batch_size is None:
+        batch_size = PANDOC_BATCH_SIZE
+
+    results = [None] * len(sources)
+    pending = []  # (posición, fragmento, clave de caché)
+    repeated = {}  # fragmento -> posiciones extra (opciones repetidas entre preguntas)
+    first_pos = {}
+    for i, src in enumerate(sources):
+        if src in first_pos:
+            repeated.setdefault(src, []).append(i)
+            continue
+        first_pos[src] = i
+        key = _cache_key(src)
+        cached = _render_cache.get(key) if key is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append((i, src, key))
+
+    if batch_size <= 1:
+        for i, src, key in pending:
+            results[i] = _convert_fragment(src, key)
+        return _fill_repeated(results, first_pos, repeated)
+
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        htmls = _pandoc_batch([src for _, src, _ in chunk])
+        if htmls is None:
+            # Fallback por fragmento: aísla el que rompe el lote
+            RENDER_STATS["batch_failures"] += 1
+            for i, src, key in chunk:
+                results[i] = _convert_fragment(src, key)
+            continue
+        for (i, _, key), html in zip(chunk, htmls):
+            results[i] = html
+            if key is not None:
+                _render_cache.put(key, html)
+    return _fill_repeated(results, first_pos, repeated)
+
+
+def _fill_repeated(results, first_pos, repeated):
+    for src, positions in repeated.items():
+        for i in positions:
+            results[i] = results[first_pos[src]]
+    return results
+
+
+# Carga al primer acceso: `from preguntas_loader import Preguntas` sigue
+# funcionando, pero el import del módulo ya no procesa el banco (los workers
+# del modo paralelo importan este módulo y no deben volver a cargarlo).
+def __getattr__(name):
+    if name == "Preguntas":
+        global Preguntas
+        Preguntas = load_preguntas_from_latex("Preguntas.tex")
+        return Preguntas
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,413 @@
+# question_bank.py
+# -*- coding: utf-8 -*-
+"""
+Banco de preguntas en memoria tal como lo usa app.py.
+
+- Modo eager (por defecto): Preguntas trae 'enunciado_html' ya renderizado
+  (desde el artefacto precompilado, ver bank_artifact.py).
+- Modo lazy (PPIA_BANK_LAZY=1): Preguntas sólo trae metadatos; el HTML se
+  obtiene al primer acceso (del artefacto si está al día, si no con Pandoc)
+  y se guarda en un LRU acotado por bytes. Opcionalmente se precalienta en
+  segundo plano la(s) semana(s) que están usando los estudiantes.
+
+Además, cada pregunta tiene su payload JSON (html + metadatos) comprimido de
+antemano en gzip y, si está instalado el paquete brotli, en br; lo sirve
+/api/q/<versión>/<qid> como recurso inmutable.
+
+El banco activo se obtiene con current_bank(). reload_bank() vuelve a leer
+el .tex, re-renderiza sólo las preguntas nuevas o modificadas (según el
+hash de cada bloque) y reemplaza el banco activo de una sola vez, así que
+cada request ve el banco viejo o el nuevo, nunca una mezcla.
+"""
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import bank_artifact
+import preguntas_loader
+from selection_index import SelectionIndex
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli sólo se sirve gzip
+    brotli = None
+
+LAZY_DEFAULT = os.environ.get("PPIA_BANK_LAZY", "0") == "1"
+HTML_LRU_BYTES = int(os.environ.get("PPIA_HTML_LRU_BYTES", str(8 * 1024 * 1024)))
+WARMUP_DEFAULT = os.environ.get("PPIA_BANK_WARMUP", "1") == "1"
+
+# Semanas posibles (app.set_week acota a 1..16): el catálogo se precalcula para todas
+CATALOG_WEEKS = range(1, 17)
+
+# El modo lazy puede renderizar en caliente: guardamos el caché al salir
+atexit.register(preguntas_loader.save_render_cache)
+
+
+class HtmlLRU:
+    """LRU qid -> HTML acotado por el tamaño total del HTML guardado."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, qid):
+        with self._lock:
+            html = self._data.get(qid)
+            if html is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(qid)
+            self.hits += 1
+            return html
+
+    def put(self, qid, html: str):
+        with self._lock:
+            old = self._data.pop(qid, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._data[qid] = html
+            self._bytes += len(html)
+            while len(self._data) > 1 and self._bytes > self.max_bytes:
+                _, v = self._data.popitem(last=False)
+                self._bytes -= len(v)
+                self.evictions += 1
+
+    def __contains__(self, qid):
+        return qid in self._data
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def full(self) -> bool:
+        return self._bytes >= self.max_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class QuestionPayload:
+    """
+    Cuerpo JSON de una pregunta en cada codificación + ETag fuerte (hash del contenido).
+    degraded: el HTML salió del fallback sin Pandoc (no se cachea como inmutable).
+    """
+    __slots__ = ("bodies", "etag", "degraded")
+
+    def __init__(self, body: bytes, degraded: bool = False):
+        self.degraded = degraded
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11)
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+
+    def __len__(self):
+        return sum(len(b) for b in self.bodies.values())
+
+
+class QuestionBank:
+    """
+    preguntas: dict[int] -> metadatos (mismo formato que preguntas_loader.Preguntas;
+    en modo lazy sin 'enunciado_html').
+    html_source: callable(qid) -> HTML, sólo en modo lazy.
+    hashes: qid -> hash del bloque fuente (para la recarga incremental).
+    """
+
+    def __init__(self, preguntas: dict, html_source=None, hashes=None, lru_bytes=HTML_LRU_BYTES):
+        self.preguntas = preguntas
+        self.hashes = hashes or {}
+        # Índice de selección (tema/semana/dificultad): se arma una vez por carga
+        self.index = SelectionIndex(preguntas)
+        self.version = _bank_version(self.hashes)
+        self._catalog = self._build_catalog()
+        self.lazy = html_source is not None
+        self._html_source = html_source
+        self._lru = HtmlLRU(lru_bytes) if self.lazy else None
+        self._warmed = set()
+        self._warm_lock = threading.Lock()
+        # qid -> QuestionPayload (en modo lazy, acotado como el HTML)
+        self._payloads = HtmlLRU(lru_bytes) if self.lazy else {}
+
+    def _build_catalog(self) -> dict:
+        """semana -> (JSON de /api/themes_difs ya serializado, ETag)."""
+        return {week: self._catalog_entry(week) for week in CATALOG_WEEKS}
+
+    def _catalog_entry(self, week: int):
+        temas = self.index.temas_for_week(week)
+        body = json.dumps({"difs": self.index.difs_for_temas(temas, week), "temas": temas},
+                          separators=(",", ":"))
+        return body, f"{self.version}-w{week}"
+
+    def catalog(self, week: int):
+        """(cuerpo JSON, ETag) de temas/dificultades para la semana; cambia con la versión del banco."""
+        entry = self._catalog.get(week)
+        return entry if entry is not None else self._catalog_entry(week)
+
+    def html(self, qid: int) -> str:
+        """enunciado_html de la pregunta (renderizado al primer acceso en modo lazy)."""
+        if not self.lazy:
+            return self.preguntas[qid]["enunciado_html"]
+        html = self._lru.get(qid)
+        if html is None:
+            html = self._html_source(qid)
+            self._lru.put(qid, html)
+        return html
+
+    def content_version(self, qid: int) -> str:
+        """
+        Versión del contenido de UNA pregunta (hash de su bloque + flags de
+        Pandoc). No cambia si una recarga sólo toca otras preguntas, así las
+        URLs inmutables de /api/q siguen valiendo para las que no cambiaron.
+        """
+        src = self.hashes.get(qid)
+        if src is None:
+            return self.version
+        return _bank_version({qid: src})
+
+    def payload(self, qid: int) -> QuestionPayload:
+        """Payload precomprimido de la pregunta (se arma al primer acceso si no se precalculó)."""
+        p = self._payloads.get(qid)
+        if p is None:
+            q = self.preguntas[qid]
+            html = self.html(qid)
+            body = json.dumps({
+                "question_id": qid,
+                "html": html,
+                "tema": q["tema"],
+                "dif": q["dif"],
+                "week": q["week"],
+                # False si ya viene en MathML (o sin matemática): el front no carga MathJax
+                "needs_mathjax": preguntas_loader.needs_mathjax(html),
+            }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            p = QuestionPayload(body, preguntas_loader.has_fallback(html))
+            if self.lazy:
+                self._payloads.put(qid, p)
+            else:
+                self._payloads[qid] = p
+        return p
+
+    def precompress(self, reuse=None, changed=()):
+        """
+        Modo eager: arma y comprime todos los payloads al cargar. `reuse` es el
+        banco anterior: sus payloads de preguntas sin cambios se conservan.
+        """
+        if self.lazy:
+            return
+        for qid in self.preguntas:
+            if reuse is not None and qid not in changed and qid in reuse._payloads:
+                self._payloads[qid] = reuse._payloads[qid]
+            else:
+                self.payload(qid)
+
+    def warm_week(self, week: int):
+        """Precalienta en segundo plano el HTML de las preguntas con week <= week."""
+        if not (self.lazy and WARMUP_DEFAULT):
+            return
+        with self._warm_lock:
+            if week in self._warmed:
+                return
+            self._warmed.add(week)
+        qids = [qid for qid, q in self.preguntas.items() if q["week"] <= week]
+        threading.Thread(target=self._warm, args=(qids,), daemon=True,
+                         name=f"bank-warmup-w{week}").start()
+
+    def _warm(self, qids):
+        for qid in qids:
+            # No tiene sentido renderizar más de lo que cabe: sólo desplazaría lo ya caliente
+            if self._lru.full():
+                break
+            if qid not in self._lru:
+                self._lru.put(qid, self._html_source(qid))
+        preguntas_loader.save_render_cache()
+
+    def stats(self) -> dict:
+        return {
+            "questions": len(self.preguntas),
+            "lazy": self.lazy,
+            "html_lru": self._lru.stats() if self.lazy else {},
+            "payloads": self._payloads.stats() if self.lazy else {"entries": len(self._payloads)},
+        }
+
+
+def _bank_version(hashes: dict) -> str:
+    """Versión corta del banco: cambia si cambia cualquier bloque o los flags/versión de Pandoc."""
+    h = hashlib.sha1(f"{' '.join(preguntas_loader.PANDOC_FLAGS)};{preguntas_loader.pandoc_version()};"
+                     .encode("utf-8"))
+    for qid in sorted(hashes):
+        h.update(f"{qid}:{hashes[qid]};".encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def _artifact_html_source(path: str):
+    # Una conexión por proceso: tras un fork (workers de gunicorn) se reabre
+    state = {"pid": os.getpid(), "con": bank_artifact.open_artifact(path)}
+    lock = threading.Lock()
+
+    def source(qid):
+        with lock:
+            if state["pid"] != os.getpid():
+                state["pid"] = os.getpid()
+                state["con"] = bank_artifact.open_artifact(path)
+            return bank_artifact.artifact_html(state["con"], qid)
+
+    return source
+
+
+def _latex_html_source(records: dict):
+    def source(qid):
+        return preguntas_loader.render_question_html(records[qid])
+
+    return source
+
+
+def load_question_bank(tex_name: str = "Preguntas.tex", lazy=None) -> QuestionBank:
+    """
+    Construye el banco. En modo lazy lee sólo metadatos: del artefacto si está
+    al día (y de ahí el HTML por pregunta), o parseando el .tex sin renderizar.
+    """
+    if lazy is None:
+        lazy = LAZY_DEFAULT
+    path = bank_artifact.artifact_path(bank_artifact.resolve_tex_path(tex_name))
+    if not lazy:
+        preguntas, hashes = bank_artifact.load_bank_and_hashes(tex_name)
+        bank = QuestionBank(preguntas, hashes=hashes)
+        bank.precompress()
+        return bank
+
+    if bank_artifact.is_fresh(tex_name):
+        return QuestionBank(bank_artifact.load_artifact_meta(path), _artifact_html_source(path),
+                            hashes=bank_artifact.load_hashes(path))
+
+    records = preguntas_loader.parse_preguntas_from_latex(tex_name)
+    return QuestionBank(_metadata(records), _latex_html_source(records),
+                        hashes={qid: rec["src_hash"] for qid, rec in records.items()})
+
+
+def _metadata(records: dict) -> dict:
+    return {
+        qid: {k: rec[k] for k in ("tema", "dif", "res", "week", "opts")}
+        for qid, rec in records.items()
+    }
+
+
+# ---------------------------
+# Banco activo y recarga en caliente
+# ---------------------------
+_current = None
+_reload_lock = threading.Lock()
+
+
+def current_bank() -> QuestionBank:
+    return _current
+
+
+def install_bank(bank: QuestionBank):
+    """Publica `bank` como banco activo (una sola asignación: atómica para los requests)."""
+    global _current
+    _current = bank
+
+
+def reload_bank(tex_name: str = "Preguntas.tex") -> dict:
+    """
+    Relee el .tex y compara bloque a bloque (id + hash) con el banco activo.
+    Sólo las preguntas nuevas o modificadas se renderizan; el resto reutiliza
+    su HTML. Devuelve el resumen de cambios.
+    """
+    global _current
+    with _reload_lock:
+        old = _current
+        records = preguntas_loader.parse_preguntas_from_latex(tex_name)
+        if not records:
+            # Archivo a medio guardar o vacío: mejor no tirar el banco entero
+            raise ValueError("El banco recargado no tiene preguntas; se conserva el actual")
+
+        hashes = {qid: rec["src_hash"] for qid, rec in records.items()}
+        changed = [rec for qid, rec in records.items() if old.hashes.get(qid) != rec["src_hash"]]
+        changed_ids = {rec["id"] for rec in changed}
+        removed = [qid for qid in old.preguntas if qid not in records]
+        preguntas = _metadata(records)
+
+        if old.lazy:
+            new = QuestionBank(preguntas, _latex_html_source(records), hashes=hashes,
+                               lru_bytes=old._lru.max_bytes)
+            # Lo ya renderizado y sin cambios pasa tal cual al banco nuevo
+            for qid, html in old._lru.items():
+                if qid in preguntas and qid not in changed_ids:
+                    new._lru.put(qid, html)
+        else:
+            htmls = dict(zip((rec["id"] for rec in changed),
+                             preguntas_loader.render_records_html(changed)))
+            for qid, q in preguntas.items():
+                q["enunciado_html"] = htmls[qid] if qid in htmls else old.preguntas[qid]["enunciado_html"]
+            new = QuestionBank(preguntas, hashes=hashes)
+            new.precompress(reuse=old, changed=changed_ids)
+            tex_path = bank_artifact.resolve_tex_path(tex_name)
+            try:
+                bank_artifact.write_artifact(preguntas, bank_artifact.artifact_path(tex_path),
+                                             bank_artifact.source_hash(tex_path), hashes)
+            except (OSError, sqlite3.Error):
+                pass
+
+        preguntas_loader.save_render_cache()
+        _current = new
+        return {
+            "questions": len(preguntas),
+            "added": sorted(qid for qid in changed_ids if qid not in old.preguntas),
+            "changed": sorted(qid for qid in changed_ids if qid in old.preguntas),
+            "removed": sorted(removed),
+        }
+
+
+def watch_bank(tex_name: str = "Preguntas.tex", interval: float = 2.0, logger=None):
+    """
+    Hilo que vigila el .tex (mtime/tamaño) y llama a reload_bank cuando cambia.
+    Cada proceso worker vigila por su cuenta, así todos terminan recargando.
+    El resultado de cada recarga se informa por `logger` (el de la app).
+    """
+    logger = logger or logging.getLogger(__name__)
+    tex_path = bank_artifact.resolve_tex_path(tex_name)
+
+    def stamp():
+        try:
+            st = os.stat(tex_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def loop():
+        last = stamp()
+        while True:
+            time.sleep(interval)
+            now = stamp()
+            if now is None or now == last:
+                continue
+            last = now
+            try:
+                diff = reload_bank(tex_name)
+                logger.info("Banco recargado: %s",
+                            {k: (len(v) if isinstance(v, list) else v) for k, v in diff.items()})
+            except Exception as e:
+                logger.error("No se pudo recargar el banco: %s", e)
+
+    t = threading.Thread(target=loop, daemon=True, name="bank-watcher")
+    t.start()
+    return t
@@ -0,0 +1,139 @@
+# render_cache.py
+# -*- coding: utf-8 -*-
+"""
+Caché en disco del HTML producido por Pandoc para cada fragmento LaTeX.
+
+La clave es un hash del fragmento ya sanitizado junto con la versión de
+Pandoc y los flags usados, así que basta editar una pregunta (o actualizar
+Pandoc) para que sólo esos fragmentos se vuelvan a convertir.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_FORMAT = 1
+
+# Límites por defecto (se pueden ajustar por variables de entorno)
+DEFAULT_MAX_ENTRIES = int(os.environ.get("PPIA_RENDER_CACHE_MAX_ENTRIES", "20000"))
+DEFAULT_MAX_BYTES = int(os.environ.get("PPIA_RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def fragment_key(src: str, pandoc_version: str, flags) -> str:
+    """Clave direccionada por contenido: fragmento + versión de Pandoc + flags."""
+    h = hashlib.sha256()
+    h.update((pandoc_version or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update(" ".join(flags).encode("utf-8"))
+    h.update(b"\0")
+    h.update(src.encode("utf-8"))
+    return h.hexdigest()
+
+
+class RenderCache:
+    """
+    LRU acotado por número de entradas y por bytes de HTML, persistido como
+    JSON. El orden del archivo es el orden LRU (lo más viejo primero).
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._dirty = False
+        self._new = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return
+        if raw.get("format") != CACHE_FORMAT:
+            return
+        for k, v in raw.get("entries", []):
+            self._data[k] = v
+            self._bytes += len(v)
+        self._evict()
+
+    def get(self, key):
+        with self._lock:
+            html = self._data.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html: str):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._data[key] = html
+            self._bytes += len(html)
+            self._new[key] = html
+            self.stores += 1
+            self._dirty = True
+            self._evict()
+
+    def take_new(self) -> dict:
+        """Entradas agregadas desde la última llamada (para fusionar cachés de otros procesos)."""
+        with self._lock:
+            new, self._new = self._new, {}
+            return new
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            _, v = self._data.popitem(last=False)
+            self._bytes -= len(v)
+            self.evictions += 1
+            self._dirty = True
+
+    def save(self):
+        """Escribe el caché de forma atómica (archivo temporal + rename)."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty and os.path.exists(self.path):
+                return
+            payload = {"format": CACHE_FORMAT, "entries": list(self._data.items())}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except OSError:
+                # Sin permisos de escritura (p. ej. imagen de sólo lectura): seguimos en memoria
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,104 @@
+# seen_cache.py
+# -*- coding: utf-8 -*-
+"""
+Caché por usuario de las preguntas que ya vio alguna vez (para priorizar
+las no vistas en pick_next_question).
+
+Cada usuario se guarda como un bitset (un int de Python: el bit qid está
+prendido si la vio) más el mayor interactions.id ya leído. En cada consulta
+sólo se leen las filas nuevas (id > último leído), que puede haber escrito
+este mismo proceso u otro worker, así que el caché no queda desfasado con
+varios procesos escribiendo en la misma base.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MAX_USERS = int(os.environ.get("PPIA_SEEN_CACHE_USERS", "5000"))
+IDLE_TTL = float(os.environ.get("PPIA_SEEN_CACHE_TTL", "1800"))
+
+
+class _Entry:
+    __slots__ = ("bits", "last_id", "touched")
+
+    def __init__(self):
+        self.bits = 0
+        self.last_id = 0
+        self.touched = time.monotonic()
+
+
+class SeenCache:
+    def __init__(self, max_users=MAX_USERS, idle_ttl=IDLE_TTL):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def seen_bits(self, con, user_id: int) -> int:
+        """
+        Bitset de preguntas vistas por user_id. `con` es una conexión SQLite:
+        la primera vez lee todo el historial del usuario, luego sólo lo nuevo.
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = _Entry()
+                self.loads += 1
+            else:
+                self._users.move_to_end(user_id)
+                self.refreshes += 1
+            last_id = entry.last_id
+
+        rows = con.execute(
+            "SELECT id, question_id FROM interactions WHERE user_id = ? AND id > ?",
+            (user_id, last_id)
+        ).fetchall()
+
+        with self._lock:
+            for row_id, qid in rows:
+                entry.bits |= 1 << int(qid)
+                if row_id > entry.last_id:
+                    entry.last_id = row_id
+            entry.touched = time.monotonic()
+            self._users[user_id] = entry
+            self._evict()
+            return entry.bits
+
+    def mark(self, user_id: int, qid: int):
+        """
+        Marca qid como visto tras registrar una respuesta. No mueve last_id:
+        así no se saltan filas que otro worker haya insertado antes.
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry.bits |= 1 << int(qid)
+                entry.touched = time.monotonic()
+
+    def _evict(self):
+        now = time.monotonic()
+        # Usuarios inactivos (el más viejo está al principio)
+        while self._users:
+            uid, oldest = next(iter(self._users.items()))
+            if now - oldest.touched <= self.idle_ttl and len(self._users) <= self.max_users:
+                break
+            del self._users[uid]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "loads": self.loads,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+            }
+
+
+def is_seen(bits: int, qid: int) -> bool:
+    return (bits >> qid) & 1 == 1
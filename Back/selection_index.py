@@ -0,0 +1,77 @@
+# selection_index.py
+# -*- coding: utf-8 -*-
+"""
+Índice invertido del banco para la selección de preguntas.
+
+Se construye una vez por carga del banco (QuestionBank lo crea) y evita
+recorrer todas las preguntas en cada request:
+  tema -> semana -> [(dif, qid), ...] ordenado por dificultad
+Así, buscar candidatas con week <= W y dif <= D cuesta lo proporcional a
+las semanas recorridas y al resultado, no al tamaño del banco.
+"""
+from bisect import bisect_right
+
+
+def split_temas(tema: str):
+    """'Lógica,Proposiciones' -> {'Lógica', 'Proposiciones'} (sin vacíos)."""
+    return {t.strip() for t in (tema or "").split(",") if t.strip()}
+
+
+class SelectionIndex:
+    def __init__(self, preguntas: dict):
+        # Posición de cada pregunta en el banco: las candidatas salen en ese orden
+        self._pos = {qid: i for i, qid in enumerate(preguntas)}
+        self.temas_of = {}
+        postings = {}
+        for qid, data in preguntas.items():
+            temas = frozenset(split_temas(data["tema"]))
+            self.temas_of[qid] = temas
+            for t in temas:
+                postings.setdefault(t, {}).setdefault(data["week"], []).append((data["dif"], qid))
+
+        # tema -> [(semana, difs ordenadas, qids en el mismo orden)] ordenado por semana
+        self._postings = {}
+        # tema -> primera semana en la que aparece
+        self._first_week = {}
+        for t, by_week in postings.items():
+            rows = []
+            for week in sorted(by_week):
+                pairs = sorted(by_week[week], key=lambda p: (p[0], self._pos[p[1]]))
+                rows.append((week, [d for d, _ in pairs], [q for _, q in pairs]))
+            self._postings[t] = rows
+            self._first_week[t] = rows[0][0]
+
+        # Cotas globales del banco (antes se recalculaban en cada /api/answer)
+        difs = [int(d["dif"]) for d in preguntas.values()]
+        weeks = [int(d["week"]) for d in preguntas.values()]
+        self.min_dif = min(difs) if difs else 1
+        self.max_dif = max(difs) if difs else 3
+        self.min_week = min(weeks) if weeks else 1
+        self.max_week = max(weeks) if weeks else 1
+
+    def temas_for_week(self, week: int):
+        """Temas con al menos una pregunta de semana <= week (ordenados)."""
+        return sorted(t for t, w in self._first_week.items() if w <= week)
+
+    def difs_for_temas(self, temas, week: int):
+        """Dificultades presentes en los temas dados con semana <= week (ordenadas)."""
+        difs = set()
+        for t in {t.strip() for t in temas}:
+            for w, ds, _ in self._postings.get(t, ()):
+                if w > week:
+                    break
+                difs.update(ds)
+        return sorted(difs)
+
+    def candidates(self, temas, week: int, max_dif: int):
+        """
+        Preguntas con algún tema en `temas`, week <= week y dif <= max_dif,
+        en el orden del banco.
+        """
+        found = set()
+        for t in temas:
+            for w, ds, qids in self._postings.get(t, ()):
+                if w > week:
+                    break
+                found.update(qids[:bisect_right(ds, max_dif)])
+        return sorted(found, key=self._pos.__getitem__)
@@ -0,0 +1,173 @@
+# session_store.py
+# -*- coding: utf-8 -*-
+"""
+Sesiones del lado del servidor (Flask SessionInterface) guardadas en SQLite.
+
+La cookie sólo lleva un id opaco y aleatorio; el estado del quiz queda en la
+tabla sessions (base aparte, sessions.db, para no competir con las
+escrituras de interactions) en forma compacta:
+  answered_ok_ids  -> bitset (entero en hex: bit qid prendido)
+  recent_results   -> buffer circular de RING_SIZE resultados (bits + cantidad)
+El resto de claves se guardan tal cual en JSON. Para app.py la sesión se ve
+igual que antes (listas), la conversión se hace al leer/guardar.
+
+Las sesiones vencen tras PPIA_SESSION_IDLE_S segundos sin uso; las vencidas
+se borran de a poco al guardar. Un id que no está en la tabla nunca se
+reutiliza (se emite uno nuevo), así que un cliente no puede fijar su id; y
+al autenticarse (regenerate) la sesión pasa a un id nuevo y se borra la fila
+del anterior, para que un id conocido antes del login no sirva después.
+"""
+import json
+import os
+import secrets
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from db_pool import ConnectionPool
+
+IDLE_TTL = float(os.environ.get("PPIA_SESSION_IDLE_S", str(8 * 3600)))
+RING_SIZE = 4  # la regla de dificultad adaptativa mira las últimas 4 respuestas
+CLEANUP_EVERY = 200  # guardados entre barridas de sesiones vencidas
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires REAL NOT NULL
+)
+"""
+
+
+class QuizSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=0.0):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.modified = False
+        self.rotated_from = None  # id anterior a regenerate(), se borra al guardar
+
+
+# ---------------------------
+# Forma compacta
+# ---------------------------
+def encode_state(data: dict) -> str:
+    out = dict(data)
+    ids = out.pop("answered_ok_ids", None)
+    if ids is not None:
+        bits = 0
+        for qid in ids:
+            bits |= 1 << int(qid)
+        out["_ok"] = format(bits, "x")
+    recent = out.pop("recent_results", None)
+    if recent is not None:
+        recent = list(recent)[-RING_SIZE:]
+        bits = 0
+        for i, r in enumerate(recent):
+            bits |= (1 if r else 0) << i
+        out["_rr"] = [bits, len(recent)]
+    return json.dumps(out, separators=(",", ":"))
+
+
+def decode_state(text: str) -> dict:
+    data = json.loads(text)
+    ok = data.pop("_ok", None)
+    if ok is not None:
+        bits = int(ok, 16)
+        ids, qid = [], 0
+        while bits:
+            if bits & 1:
+                ids.append(qid)
+            bits >>= 1
+            qid += 1
+        data["answered_ok_ids"] = ids
+    rr = data.pop("_rr", None)
+    if rr is not None:
+        bits, n = rr
+        data["recent_results"] = [(bits >> i) & 1 for i in range(n)]
+    return data
+
+
+class SqliteSessionInterface(SessionInterface):
+    def __init__(self, path: str, idle_ttl: float = IDLE_TTL):
+        self.pool = ConnectionPool(path)
+        self.idle_ttl = idle_ttl
+        self._saves = 0
+        con = self.pool.connect()
+        try:
+            con.execute(SCHEMA)
+            con.commit()
+        finally:
+            con.close()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            con = self.pool.connect()
+            try:
+                row = con.execute("SELECT data, expires FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            finally:
+                con.close()
+            if row is not None and row["expires"] > time.time():
+                return QuizSession(decode_state(row["data"]), sid=sid, expires=row["expires"])
+        return QuizSession(sid=secrets.token_urlsafe(18), new=True)
+
+    def regenerate(self, session: QuizSession):
+        """Pasa la sesión a un id nuevo (p. ej. al hacer login); el viejo se borra al guardar."""
+        if not session.new and session.rotated_from is None:
+            session.rotated_from = session.sid
+        session.sid = secrets.token_urlsafe(18)
+        session.new = True
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session is None:
+            return  # open_session falló (p. ej. PoolTimeout): no hay nada que guardar
+        if session.rotated_from is not None:
+            self._execute("DELETE FROM sessions WHERE sid = ?", (session.rotated_from,))
+            session.rotated_from = None
+        if not session:
+            # Sesión vacía (p. ej. logout): se borra la fila y la cookie
+            if session.modified and not session.new:
+                self._execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        # Además de los cambios, se renueva el vencimiento si ya pasó la mitad del plazo
+        if session.modified or session.expires - now < self.idle_ttl / 2:
+            self._execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                (session.sid, encode_state(dict(session)), now + self.idle_ttl)
+            )
+            self._saves += 1
+            if self._saves % CLEANUP_EVERY == 0:
+                self._execute("DELETE FROM sessions WHERE expires < ?", (now,))
+
+        if session.new:
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+    def _execute(self, sql, params):
+        con = self.pool.connect()
+        try:
+            con.execute(sql, params)
+            con.commit()
+        finally:
+            con.close()
@@ -0,0 +1,87 @@
+# conftest.py
+# -*- coding: utf-8 -*-
+"""
+Fixtures comunes: los módulos de Back/ importables, Pandoc reemplazado por
+un conversor en proceso (no hace falta tenerlo instalado) y un banco .tex
+chico en un directorio temporal.
+"""
+import atexit
+import os
+import re
+import shutil
+import sys
+import tempfile
+from html import escape
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Bases y log de auditoría de app.py en un directorio temporal. Va antes de
+# importar cualquier módulo de Back/: varios leen su ruta al importarse
+# (p. ej. audit_log.AUDIT_DIR) y escribirían junto al código.
+_APP_TMP = tempfile.mkdtemp(prefix="ppia-tests-")
+atexit.register(shutil.rmtree, _APP_TMP, True)
+os.environ.update({
+    "PPIA_DB_PATH": os.path.join(_APP_TMP, "quiz.db"),
+    "PPIA_SESSION_DB": os.path.join(_APP_TMP, "sessions.db"),
+    "PPIA_AUDIT_DIR": os.path.join(_APP_TMP, "audit"),
+    "PPIA_BANK_LAZY": "1",  # sólo metadatos: no hace falta Pandoc
+    "PPIA_BANK_WATCH": "0",
+    "PPIA_METRICS": "0",
+    "PPIA_PASSWORD_METHOD": "pbkdf2:sha256:1000",
+})
+
+import preguntas_loader  # noqa: E402
+
+BLOCK = """\\begin{{question}}{{{qid}}}{{{tema}}}{{{dif}}}{{a}}{{{week}}}{{
+{stem}
+
+\\begin{{enumerate}}
+    \\item a) Opción A de la pregunta {qid}.
+    \\item b) Opción B de la pregunta {qid}.
+\\end{{enumerate}}
+}}
+\\end{{question}}
+
+"""
+
+
+def make_block(qid: int, stem: str = None, tema: str = "lógica", dif: int = 1, week: int = 3) -> str:
+    return BLOCK.format(qid=qid, tema=tema, dif=dif, week=week,
+                        stem=stem or f"Enunciado de la pregunta {qid}.")
+
+
+def _fake_pandoc(src: str) -> str:
+    # Un <p> por párrafo, como Pandoc con texto plano (respeta los separadores de lote)
+    return "".join(f"<p>{escape(p.strip(), quote=False)}</p>\n"
+                   for p in re.split(r"\n\s*\n", src) if p.strip())
+
+
+@pytest.fixture
+def fake_pandoc(monkeypatch):
+    monkeypatch.setattr(preguntas_loader, "_run_pandoc", _fake_pandoc)
+    monkeypatch.setenv("PPIA_RENDER_CACHE", "0")
+    preguntas_loader.use_render_cache(None)
+
+
+@pytest.fixture
+def bank_tex(tmp_path, fake_pandoc):
+    """Preguntas.tex con 6 preguntas en un directorio temporal."""
+    path = tmp_path / "Preguntas.tex"
+    path.write_text("".join(make_block(qid, dif=1 + qid % 3) for qid in range(1, 7)), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def quiz_app():
+    """app.py con sus bases en _APP_TMP (se importa una vez por corrida)."""
+    import app as quiz
+    quiz.create_app(background=False)
+    yield quiz.app
+    quiz.ANSWER_WRITER.close()
+
+
+@pytest.fixture
+def client(quiz_app):
+    return quiz_app.test_client()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from answer_writer import AnswerWriter
+from db_pool import ConnectionPool
+
+
+@pytest.fixture
+def writer(tmp_path):
+    db = str(tmp_path / "quiz.db")
+    con = sqlite3.connect(db)
+    con.execute("CREATE TABLE interactions (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                "question_id INTEGER, success INTEGER, ts TEXT)")
+    con.close()
+    w = AnswerWriter(ConnectionPool(db), mode="async")
+    yield w
+    w.close()
+
+
+def _count(w):
+    con = sqlite3.connect(w.pool.path)
+    try:
+        return con.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+    finally:
+        con.close()
+
+
+def _fail_commits(w, monkeypatch):
+    def locked(rows, spilled=None):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(w, "_commit", locked)
+
+
+def _dead_pid():
+    p = subprocess.Popen([sys.executable, "-c", "pass"])
+    p.wait()
+    return p.pid
+
+
+def test_failed_batch_is_spilled_and_replayed(writer, monkeypatch):
+    _fail_commits(writer, monkeypatch)
+    for qid in range(5):
+        writer.submit(1, qid, 1, "2026-01-01T00:00:00")
+    assert writer.flush(5)
+    assert writer.spilled == 5 and _count(writer) == 0
+    assert os.path.exists(writer._spill_path())
+
+    monkeypatch.undo()
+    assert writer.flush(5)
+    assert _count(writer) == 5
+    assert not os.path.exists(writer._spill_path())
+
+
+def test_replaying_the_same_spill_twice_does_not_duplicate(writer):
+    writer._spill([(1, 1, 1, "t"), (1, 2, 0, "t")])
+    copy = writer._spill_path() + ".bak"
+    shutil.copy(writer._spill_path(), copy)
+
+    writer._replay_spill(wait=True)
+    # Caída entre el commit y el borrado: el archivo vuelve a aparecer
+    os.rename(copy, writer._spill_path())
+    writer._replay_spill(wait=True)
+
+    assert _count(writer) == 2
+    assert not os.path.exists(writer._spill_path())
+
+
+def test_only_own_or_dead_process_spills_are_claimed(writer):
+    def spill_file(pid):
+        path = f"{writer.spill_base}-{pid}.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps([f"lote-{pid}", 1, pid % 1000, 1, "t"]) + "\n")
+        return path
+
+    live = spill_file(os.getppid())
+    dead = spill_file(_dead_pid())
+    writer._replay_spill(wait=True)
+
+    assert os.path.exists(live)
+    assert not os.path.exists(dead)
+    assert _count(writer) == 1
+
+
+def test_torn_last_line_is_skipped(writer):
+    writer._spill([(1, 1, 1, "t")])
+    with open(writer._spill_path(), "a", encoding="utf-8") as f:
+        f.write('["lote-cortado", 1, 2')
+    writer._replay_spill(wait=True)
+    assert _count(writer) == 1
+
+
+def test_flush_waits_only_for_answers_submitted_before_it(writer):
+    writer.submit(1, 1, 1, "t")
+    stop = threading.Event()
+
+    def traffic():
+        while not stop.is_set():
+            writer.submit(2, 1, 1, "t")
+            time.sleep(0.001)
+
+    t = threading.Thread(target=traffic)
+    t.start()
+    try:
+        t0 = time.monotonic()
+        assert writer.flush(5)
+        assert time.monotonic() - t0 < 2
+    finally:
+        stop.set()
+        t.join()
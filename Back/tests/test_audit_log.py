@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import glob
+import gzip
+import json
+import os
+
+import audit_log
+from audit_log import AuditLog
+
+
+def _answers(n, start=0):
+    return [(1, start + i, 1, f"2026-01-01T00:00:{i % 60:02d}") for i in range(n)]
+
+
+def test_rotates_by_size_and_keeps_every_record(tmp_path):
+    log = AuditLog(str(tmp_path), max_bytes=2000, rotate_s=0)
+    for k in range(20):
+        log.log_answers(_answers(10, start=k * 10))
+
+    assert log.rotations > 0
+    assert glob.glob(str(tmp_path / "audit-*.jsonl.gz"))
+    answers = [r for r in audit_log.iter_records(str(tmp_path)) if r["t"] == "answer"]
+    assert [r["question_id"] for r in answers] == list(range(200))
+    # Cada segmento empieza con su encabezado
+    for path in glob.glob(str(tmp_path / "audit-*.jsonl.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            assert json.loads(f.readline())["t"] == "segment"
+
+
+def test_segment_header_is_read_once(tmp_path, monkeypatch):
+    log = AuditLog(str(tmp_path), rotate_s=3600)
+    log.log_answers(_answers(1))
+    reads = []
+    monkeypatch.setattr(audit_log, "_opened_at", lambda path, st: reads.append(path) or 0.0)
+
+    for k in range(50):
+        log.log_answers(_answers(1, start=k))
+    assert reads == []
+
+
+def test_rotates_segment_opened_by_another_process(tmp_path):
+    # Archivo activo con encabezado viejo escrito por otro proceso / arranque anterior
+    active = tmp_path / audit_log.ACTIVE_NAME
+    active.write_text(json.dumps({"t": "segment", "opened": 0}) + "\n", encoding="utf-8")
+    log = AuditLog(str(tmp_path), rotate_s=3600)
+    log.log_answers(_answers(1))
+
+    assert log.rotations == 1
+    with open(active, encoding="utf-8") as f:
+        assert json.loads(f.readline())["opened"] > 0
+
+
+def test_compress_failure_is_logged(tmp_path, caplog):
+    log = AuditLog(str(tmp_path))
+    log._compress(str(tmp_path / "no-existe.jsonl"))
+    assert "no se pudo comprimir" in caplog.text
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import db_init
+
+
+def _layout(con):
+    """Columnas e índices de cada tabla (sin depender del texto del DDL)."""
+    tables = [r[0] for r in con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    return {
+        t: (
+            [tuple(r) for r in con.execute(f"PRAGMA table_info({t})")],
+            sorted((r[1], tuple(c[2] for c in con.execute(f"PRAGMA index_info({r[1]})")))
+                   for r in con.execute(f"PRAGMA index_list({t})") if r[1].startswith("idx_")),
+        )
+        for t in tables
+    }
+
+
+def test_db_init_matches_the_app_schema(quiz_app, tmp_path):
+    import app as quiz
+
+    con = sqlite3.connect(str(tmp_path / "init.db"))
+    db_init.init_schema(con)
+    app_con = sqlite3.connect(quiz.DB_PATH)
+    try:
+        init_layout, app_layout = _layout(con), _layout(app_con)
+    finally:
+        con.close()
+        app_con.close()
+
+    for table in ("users", "interactions", "question_stats", "user_stats", "user_theme_stats"):
+        assert init_layout[table] == app_layout[table], table
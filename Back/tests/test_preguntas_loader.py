@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import preguntas_loader
+from conftest import make_block
+
+
+@pytest.fixture
+def broken_bank(tmp_path, fake_pandoc, monkeypatch):
+    """12 preguntas; Pandoc falla en las que mencionan ROMPE (van al HTML de respaldo)."""
+    run_pandoc = preguntas_loader._run_pandoc
+
+    def flaky(src):
+        if "ROMPE" in src:
+            raise RuntimeError("pandoc falló")
+        return run_pandoc(src)
+
+    monkeypatch.setattr(preguntas_loader, "_run_pandoc", flaky)
+    path = tmp_path / "Preguntas.tex"
+    path.write_text("".join(
+        make_block(qid, stem=f"Enunciado {qid}" + (" ROMPE" if qid % 4 == 0 else ""))
+        for qid in range(1, 13)), encoding="utf-8")
+    return str(path)
+
+
+def _load(path, workers):
+    before = dict(preguntas_loader.RENDER_STATS)
+    preguntas = preguntas_loader.load_preguntas_from_latex(path, batch_size=0, workers=workers)
+    delta = {k: preguntas_loader.RENDER_STATS[k] - before[k] for k in before}
+    return preguntas, delta, dict(preguntas_loader.LOAD_STATS)
+
+
+def test_parallel_load_matches_sequential(broken_bank):
+    seq, seq_delta, _ = _load(broken_bank, workers=1)
+    par, par_delta, _ = _load(broken_bank, workers=3)
+
+    assert par == seq
+    assert par_delta == seq_delta
+    assert par_delta["fallbacks"] == 3
+
+
+def test_parallel_load_labels_each_slice(broken_bank):
+    _, _, stats = _load(broken_bank, workers=3)
+    assert [w["slice"] for w in stats["workers"]] == [0, 1, 2]
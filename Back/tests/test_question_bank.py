@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import bank_artifact
+from question_bank import load_question_bank
+
+from conftest import make_block
+
+
+def _edit_block(path: str, qid: int, stem: str):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    old = f"Enunciado de la pregunta {qid}."
+    assert old in text
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text.replace(old, stem))
+
+
+def test_version_changes_when_a_block_is_edited(bank_tex):
+    bank = load_question_bank(bank_tex, lazy=False)
+    before = {qid: bank.content_version(qid) for qid in bank.preguntas}
+
+    _edit_block(bank_tex, 4, "Enunciado corregido.")
+    bank = load_question_bank(bank_tex, lazy=False)
+
+    assert "corregido" in bank.preguntas[4]["enunciado_html"]
+    assert bank.content_version(4) != before[4]
+    assert all(bank.content_version(qid) == before[qid] for qid in before if qid != 4)
+
+
+def test_stale_artifact_hashes_are_not_reused(bank_tex, monkeypatch):
+    # El artefacto viejo queda en disco cuando no se puede reescribir
+    # (render degradado o directorio de sólo lectura)
+    bank = load_question_bank(bank_tex, lazy=False)
+    old_version = bank.content_version(2)
+    monkeypatch.setattr(bank_artifact, "write_artifact", lambda *a, **k: False)
+
+    _edit_block(bank_tex, 2, "Enunciado nuevo.")
+    bank = load_question_bank(bank_tex, lazy=False)
+
+    assert "nuevo" in bank.preguntas[2]["enunciado_html"]
+    assert bank.content_version(2) != old_version
+
+
+def test_lazy_bank_versions_follow_the_source(bank_tex):
+    load_question_bank(bank_tex, lazy=False)  # deja el artefacto al día
+    lazy = load_question_bank(bank_tex, lazy=True)
+    version = lazy.content_version(5)
+
+    with open(bank_tex, "a", encoding="utf-8") as f:
+        f.write(make_block(7))
+    _edit_block(bank_tex, 5, "Otro enunciado.")
+    lazy = load_question_bank(bank_tex, lazy=True)
+
+    assert lazy.content_version(5) != version
+    assert 7 in lazy.preguntas
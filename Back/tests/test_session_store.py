@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import secrets
+
+BASE = "https://localhost"  # la cookie de sesión es Secure
+COOKIE = "ppia_session"
+
+
+def _register(client, email, password="pw"):
+    r = client.post(BASE + "/api/register", json=dict(
+        full_name="A B", email=email, uniandes_code="1", magistral="x",
+        complementarios="y", password=password))
+    assert r.status_code in (200, 201), r.get_json()
+
+
+def _sid(client):
+    cookie = client.get_cookie(COOKIE, domain="localhost")
+    return cookie.value if cookie else None
+
+
+def test_login_issues_a_new_session_id(client):
+    email = f"s{secrets.randbelow(10 ** 9)}@uniandes.edu.co"
+    _register(client, email)
+
+    # Sesión anónima previa al login (id que un atacante podría haber fijado)
+    with client.session_transaction(base_url=BASE) as s:
+        s["user_week"] = 3
+    before = _sid(client)
+    assert before
+
+    r = client.post(BASE + "/api/login", json=dict(email=email, password="pw"))
+    assert r.status_code == 200
+    after = _sid(client)
+    assert after and after != before
+    assert client.get(BASE + "/api/me").get_json()["logged"] is True
+
+    # El id anterior ya no existe en el servidor
+    client.set_cookie(COOKIE, before, domain="localhost")
+    assert client.get(BASE + "/api/me").get_json()["logged"] is False
+
+
+def test_failed_login_keeps_the_session_id(client):
+    email = f"s{secrets.randbelow(10 ** 9)}@uniandes.edu.co"
+    _register(client, email)
+    with client.session_transaction(base_url=BASE) as s:
+        s["user_week"] = 3
+    before = _sid(client)
+
+    r = client.post(BASE + "/api/login", json=dict(email=email, password="otra"))
+    assert r.status_code == 401
+    assert _sid(client) == before
@@ -0,0 +1,14 @@
+# wsgi.py
+# -*- coding: utf-8 -*-
+"""
+Punto de entrada WSGI para producción:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Con preload_app (gunicorn.conf.py) este módulo se importa una sola vez en el
+master: el banco se parsea/carga ahí y los workers lo comparten tras el fork.
+Los hilos de fondo los arranca cada worker en post_fork.
+"""
+from app import create_app
+
+app = create_app(background=False)
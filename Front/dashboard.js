@@ -110,28 +110,24 @@ document.getElementById("btn-start").addEventListener("click", async () => {
 });
 
 async function renderStats() {
-  const h = await getJSON("/api/history");
-  if (h.error) return;
-
-  const items = h.items || [];
-  const attempts = items.length;
-  const correct = items.filter(x => x.success).length;
-  const accuracy = attempts ? Math.round((correct / attempts) * 100) : 0;
-
-  // racha actual de aciertos
-  let streak = 0;
-  for (const it of items) {
-    if (it.success) streak++;
-    else break;
-  }
+  // Resumen ya agregado en el servidor (no hace falta bajar el historial)
+  const s = await getJSON("/api/dashboard/summary");
+  if (s.error) return;
+
+  const t = s.total || {};
+  const accuracy = Math.round((t.accuracy || 0) * 100);
 
-  const uniqueQ = new Set(items.map(x => x.question_id)).size;
+  const temas = (s.temas || []).map(x => `
+    <div class="stat"><div class="hint">${x.tema}</div><div class="value">${Math.round(x.accuracy * 100)}%</div>
+    <div class="hint">${x.successes}/${x.attempts} · racha ${x.streak}</div></div>
+  `).join("");
 
   document.getElementById("stats").innerHTML = `
-    <div class="stat"><div class="hint">Intentos</div><div class="value">${attempts}</div></div>
-    <div class="stat"><div class="hint">Aciertos</div><div class="value ok">${correct}</div></div>
+    <div class="stat"><div class="hint">Intentos</div><div class="value">${t.attempts || 0}</div></div>
+    <div class="stat"><div class="hint">Aciertos</div><div class="value ok">${t.successes || 0}</div></div>
     <div class="stat"><div class="hint">Tasa de acierto</div><div class="value">${accuracy}%</div></div>
-    <div class="stat"><div class="hint">Racha actual</div><div class="value">${streak}</div></div>
-    <div class="stat"><div class="hint">Preguntas únicas</div><div class="value">${uniqueQ}</div></div>
+    <div class="stat"><div class="hint">Racha actual</div><div class="value">${t.streak || 0}</div></div>
+    <div class="stat"><div class="hint">Preguntas únicas</div><div class="value">${t.unique_questions || 0}</div></div>
+    ${temas}
   `;
 }
@@ -16,10 +16,46 @@ async function postJSON(url, body) {
 
 let current = null;
 
+// MathJax (CDN) se carga sólo la primera vez que una pregunta lo necesita:
+// con el banco en MathML las preguntas se muestran sin tipografiar nada.
+const MATHJAX_SRC = "https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js";
+let mathJaxLoading = null;
+
+function ensureMathJax() {
+  if (!mathJaxLoading) {
+    mathJaxLoading = new Promise((resolve, reject) => {
+      const s = document.createElement("script");
+      s.src = MATHJAX_SRC;
+      s.async = true;
+      s.onload = () => window.MathJax.startup.promise.then(resolve);
+      s.onerror = reject;
+      document.head.appendChild(s);
+    });
+  }
+  return mathJaxLoading;
+}
+
+// Los endpoints del quiz devuelven {question_id, version}; el contenido es
+// inmutable por versión de cada pregunta, así que el navegador lo cachea.
+// Si la pregunta ya no existe (p. ej. se recargó el banco), se vuelve a
+// preguntar cuál es la activa con /api/question.
+async function loadQuestion(ref, retry = true) {
+  const r = await fetch(`${API}/api/q/${ref.version}/${ref.question_id}`);
+  if (r.ok) return r.json();
+  if (retry && r.status === 404) {
+    let q = await getJSON("/api/question");
+    // La activa también fue retirada: se avanza a la siguiente sin cortar el quiz
+    if (q.error) q = await postJSON("/api/next_question", { continue: true });
+    if (q.question_id) return loadQuestion(q, false);
+    return { error: q.error || q.message };
+  }
+  return { error: "No se pudo cargar la pregunta. Intenta de nuevo." };
+}
+
 (async function init() {
   const cached = sessionStorage.getItem("current_question");
   if (cached) {
-    current = JSON.parse(cached);
+    current = await loadQuestion(JSON.parse(cached));
     renderQuestion(current);
     sessionStorage.removeItem("current_question");
   } else {
@@ -29,12 +65,16 @@ let current = null;
       location.href = "dashboard.html";
       return;
     }
-    current = q;
+    current = await loadQuestion(q);
     renderQuestion(current);
   }
 })();
 
 function renderQuestion(q) {
+  if (q.error) {
+    document.getElementById("q-box").textContent = q.error;
+    return;
+  }
   // Meta
   document.getElementById("q-meta").innerHTML = `
     <span class="badge">Tema(s): ${q.tema}</span>
@@ -46,15 +86,20 @@ function renderQuestion(q) {
   const box = document.getElementById("q-box");
   box.innerHTML = q.html;
 
-  // Reprocesar matemáticas solo dentro del contenedor
-  if (window.MathJax && window.MathJax.typesetPromise) {
-    window.MathJax.typesetPromise([box]).catch(() => {});
-  } else if (window.MathJax && typeof window.MathJax.typeset === "function") {
-    // Fallback para builds que solo exponen typeset()
-    window.MathJax.typeset();
+  // Reprocesar matemáticas solo dentro del contenedor (y sólo si hay TeX sin convertir)
+  if (q.needs_mathjax !== false) {
+    ensureMathJax().then(() => {
+      if (window.MathJax.typesetPromise) {
+        window.MathJax.typesetPromise([box]).catch(() => {});
+      } else if (typeof window.MathJax.typeset === "function") {
+        // Fallback para builds que solo exponen typeset()
+        window.MathJax.typeset();
+      }
+    }).catch(() => {});
   }
 
   // Reset UI
+  document.getElementById("btn-send").disabled = false;
   document.getElementById("feedback").textContent = "";
   document.getElementById("continue-row").style.display = "none";
   document.getElementById("inp-answer").value = "";
@@ -64,31 +109,57 @@ function renderQuestion(q) {
   if (ans) ans.focus();
 }
 
+// Siguiente pregunta ya elegida por /api/answer_next (su contenido se pide
+// mientras el estudiante lee la retroalimentación); si no quedan, el mensaje
+// de fin que mandó el servidor
+let upcoming = null;
+let endMessage = null;
+
 document.getElementById("btn-send").addEventListener("click", async () => {
+  const btn = document.getElementById("btn-send");
   const answer = document.getElementById("inp-answer").value.trim();
   if (!answer) return alert("Escribe tu respuesta (letra).");
-  const res = await postJSON("/api/answer", { answer });
+  // Una sola respuesta por pregunta: se vuelve a habilitar al mostrar la siguiente
+  btn.disabled = true;
+  let res;
+  try {
+    res = await postJSON("/api/answer_next", { answer, question_id: current.question_id });
+  } catch (e) {
+    btn.disabled = false;
+    return alert("No se pudo enviar la respuesta. Intenta de nuevo.");
+  }
+  const next = res.next || { end: true };
+  upcoming = next.end ? null : loadQuestion(next);
+  endMessage = next.end ? next.message : null;
   const fb = document.getElementById("feedback");
-  fb.innerHTML = res.correct
-    ? `<b class="ok">¡Correcto!</b> ¿Deseas continuar?`
-    : `<b class="bad">Incorrecta.</b> ¿Deseas continuar?`;
+  if (res.error) {
+    fb.textContent = res.error;
+  } else {
+    fb.innerHTML = res.correct
+      ? `<b class="ok">¡Correcto!</b> ¿Deseas continuar?`
+      : `<b class="bad">Incorrecta.</b> ¿Deseas continuar?`;
+  }
   document.getElementById("continue-row").style.display = "flex";
 });
 
 document.getElementById("btn-yes").addEventListener("click", async () => {
-  const r = await postJSON("/api/next_question", { continue: true });
-  if (r.end) {
-    showBye();
-  } else {
-    renderQuestion(r);
+  if (!upcoming) {
+    showBye(endMessage);
+    return;
   }
+  current = await upcoming;
+  upcoming = null;
+  renderQuestion(current);
 });
 
 document.getElementById("btn-no").addEventListener("click", async () => {
   const r = await postJSON("/api/next_question", { continue: false });
-  showBye();
+  showBye(r.message);
 });
 
-function showBye() {
+function showBye(message) {
+  const msg = document.getElementById("bye-msg");
+  msg.textContent = message || "";
+  msg.hidden = !message;
   document.getElementById("bye-overlay").style.display = "flex";
 }